@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 1024   # LRU bound on cached reply lists
+TTL_SECONDS = 300    # cached replies go stale after 5 minutes
+
+# key -> (expires_at, replies), oldest first
+_entries = OrderedDict()
+# key -> task generating replies for that key right now
+_in_flight = {}
+# key -> live-update callers holding the in-flight task (see acquire/release)
+_holders = {}
+# in-flight keys a /suggest caller is waiting on, or timed out on and expects cached
+_wanted = set()
+
+stats = {"hits": 0, "misses": 0, "coalesced": 0, "cancelled": 0}
+
+def normalize(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so near-identical transcripts share a key."""
+    text = re.sub(r"[^\w\s£']", " ", text.lower())
+    return " ".join(text.split())
+
+def make_key(context: str, intent: str, transcript: str, conversation_history: str) -> tuple:
+    """
+    Build the cache key for a suggestion request.
+
+    Trailing "[Heard]" lines that repeat the current transcript are dropped
+    before hashing the history window, so a double tap (which records the
+    same transcript again) maps to the same key as the first request.
+    """
+    lines = conversation_history.split("\n") if conversation_history else []
+    while lines and lines[-1] == f"[Heard]: {transcript}":
+        lines.pop()
+    digest = hashlib.blake2b("\n".join(lines).encode(), digest_size=16).hexdigest()
+    return (context, intent, normalize(transcript), digest)
+
+def get(key):
+    """Return cached replies for key, or None on a miss or expired entry."""
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    expires_at, replies = entry
+    if expires_at < time.monotonic():
+        del _entries[key]
+        return None
+    _entries.move_to_end(key)
+    return list(replies)
+
+def put(key, replies: list[str]):
+    _entries[key] = (time.monotonic() + TTL_SECONDS, list(replies))
+    _entries.move_to_end(key)
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+def _on_done(key, task: asyncio.Task):
+    # A cancelled task may finish after a new one took its key
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+        _holders.pop(key, None)
+        _wanted.discard(key)
+    if task.cancelled():
+        return
+    if task.exception() is None:
+        put(key, task.result())
+
+async def get_or_generate(key, generate) -> list[str]:
+    """
+    Return cached replies for key, or run generate() to produce them.
+
+    Concurrent misses for the same key share one generate() call. The call
+    runs as its own task, so a caller going away doesn't cancel it for the
+    others. Exceptions propagate to every waiting caller and aren't cached.
+
+    Args:
+        key: Key from make_key
+        generate: Zero-argument coroutine function returning a list of replies
+    """
+    replies = get(key)
+    if replies is not None:
+        stats["hits"] += 1
+        return replies
+
+    task = _start(key, generate)
+    _wanted.add(key)
+    return list(await asyncio.shield(task))
+
+def _start(key, generate) -> asyncio.Task:
+    task = _in_flight.get(key)
+    if task is not None:
+        stats["coalesced"] += 1
+        return task
+    stats["misses"] += 1
+    task = asyncio.ensure_future(generate())
+    _in_flight[key] = task
+    task.add_done_callback(lambda t: _on_done(key, t))
+    return task
+
+def acquire(key, generate) -> asyncio.Task:
+    """
+    Like get_or_generate, but return the shared generation task for a
+    caller that may later give it up with release(). Check get() first.
+    """
+    task = _start(key, generate)
+    _holders[key] = _holders.get(key, 0) + 1
+    return task
+
+def release(key, task: asyncio.Task):
+    """
+    Give up a task from acquire(). Once no holder and no /suggest caller
+    needs it, a generation still running is cancelled.
+    """
+    if _in_flight.get(key) is not task:
+        return
+    _holders[key] -= 1
+    if _holders[key] > 0 or key in _wanted:
+        return
+    del _in_flight[key]
+    del _holders[key]
+    task.cancel()
+    stats["cancelled"] += 1
+
+def get_stats() -> dict:
+    return {**stats, "size": len(_entries), "in_flight": len(_in_flight)}
+
+def clear():
+    _entries.clear()
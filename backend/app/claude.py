@@ -1,6 +1,58 @@
+import logging
 import os
 import re
-from anthropic import Anthropic
+import time
+import httpx
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+
+from .tokens import estimate_tokens
+from . import logs
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+MODEL = "claude-3-haiku-20240307"
+
+# Connection pool shared by every request; keep-alive avoids a TLS handshake per call
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 100
+KEEPALIVE_EXPIRY = 30.0  # seconds an idle connection stays open
+
+# Fail fast: the route's latency budget and hedging handle slow calls, so the
+# SDK shouldn't sit on a request for its default 10 minutes or retry twice
+REQUEST_TIMEOUT = 10.0
+CONNECT_TIMEOUT = 2.0
+MAX_RETRIES = 1
+
+client: AsyncAnthropic | None = None
+
+def init_client():
+    """Create the shared Anthropic client. Called once at app startup."""
+    global client
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    if not api_key:
+        client = None
+        return
+
+    client = AsyncAnthropic(
+        api_key=api_key,
+        timeout=httpx.Timeout(REQUEST_TIMEOUT, connect=CONNECT_TIMEOUT),
+        max_retries=MAX_RETRIES,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        ),
+    )
+
+async def close_client():
+    """Close the shared client and its connection pool. Called at app shutdown."""
+    global client
+    if client is not None:
+        await client.close()
+        client = None
 
 def _clean_lines(text: str) -> list[str]:
     lines = []
@@ -22,43 +74,12 @@ def _clean_lines(text: str) -> list[str]:
             lines.append(s)
     return lines
 
-def generate_replies(message: str, context: str, conversation_history: str = "", common_replies: list[str] = None) -> list[str]:
-    """
-    Generate reply suggestions using Claude.
-    
-    Args:
-        message: The current transcript/message heard
-        context: The conversation context (medical, restaurant, etc.)
-        conversation_history: Formatted string of past exchanges
-        common_replies: List of replies that have worked well in this context
-    """
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        raise RuntimeError("ANTHROPIC_API_KEY not set")
-
-    client = Anthropic(api_key=api_key)
-
-    # Build the prompt with history context
-    history_section = ""
-    if conversation_history:
-        history_section = f"""
-Previous conversation:
-{conversation_history}
-
-Based on this conversation flow, generate contextually appropriate replies.
-"""
-
-    # Include common replies as hints
-    common_replies_section = ""
-    if common_replies:
-        common_replies_section = f"""
-Replies that have worked well in similar {context} situations:
-{', '.join(common_replies[:5])}
-
-Use these as inspiration but generate fresh, contextually appropriate options.
-"""
-
-    prompt = f"""You are helping generate reply options for a speech-assistance app. The user has difficulty speaking and needs quick tap-to-speak responses.
+# Static instructions, sent as a system block marked for provider-side prompt
+# caching. Everything per-request goes in the user message after it, so the
+# prefix stays byte-identical across calls. (Anthropic only caches prefixes
+# above a minimum length, 2048 tokens on Haiku; below that the marker is
+# ignored at no cost.)
+SYSTEM_PROMPT = """You are helping generate reply options for a speech-assistance app. The user has difficulty speaking and needs quick tap-to-speak responses.
 
 Generate exactly 9 short reply options for the user to tap. Do not add preamble to your response, get straight to the point with no additions.
 
@@ -72,22 +93,98 @@ Rules:
 - Replies should be the USER's possible replies (not the conversation partner)
 - Replies should not be AI preamble
 - Consider the conversation flow and what would be a natural next response
+- Replies that worked well before are inspiration only; generate fresh, contextually appropriate options"""
+
+PROMPT_TOKEN_BUDGET = 1000  # estimated input tokens (system + user) per call
+MAX_TOKENS = 350
+TEMPERATURE = 0.6
+
+# Token usage reported by the API, summed over all calls
+usage = {
+    "calls": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_read_input_tokens": 0,
+    "cache_creation_input_tokens": 0,
+}
+
+def _user_message(message: str, context: str, history_lines: list[str], common_replies: list[str]) -> str:
+    parts = [f"Context: {context}"]
+    if history_lines:
+        parts.append("Previous conversation:\n" + "\n".join(history_lines))
+    if common_replies:
+        parts.append(f"Replies that have worked well in similar {context} situations:\n" + ", ".join(common_replies))
+    # Empty when prefetching the next turn before the other person has spoken
+    if message:
+        parts.append(f'Current message heard: "{message}"')
+    else:
+        parts.append("Nothing new has been heard since the user's last reply; suggest what they are likely to need next.")
+    parts.append("Generate 9 appropriate replies the user could say next:")
+    return "\n\n".join(parts)
+
+def build_request(message: str, context: str, conversation_history: str = "", common_replies: list[str] = None) -> dict:
+    """
+    Build the messages.create arguments for a reply-generation call.
 
-Context: {context}
-{history_section}
-{common_replies_section}
-Current message heard: "{message}"
+    The static rules go in a cacheable system block; context, history, common
+    replies and the transcript go in the user message. If the estimate goes
+    over PROMPT_TOKEN_BUDGET, common replies are dropped first, then the
+    oldest history lines.
+    """
+    history_lines = conversation_history.split("\n") if conversation_history else []
+    common = list(common_replies or [])[:5]
+
+    budget = PROMPT_TOKEN_BUDGET - estimate_tokens(SYSTEM_PROMPT)
+    content = _user_message(message, context, history_lines, common)
+    while estimate_tokens(content) > budget and (common or history_lines):
+        if common:
+            common.pop()
+        else:
+            history_lines.pop(0)
+        content = _user_message(message, context, history_lines, common)
+
+    return {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+        "system": [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}],
+        "messages": [{"role": "user", "content": content}],
+    }
+
+def _record_usage(res_usage):
+    """Add one call's reported token usage to the running totals."""
+    if res_usage is None:
+        return
+    usage["calls"] += 1
+    for k in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+        usage[k] += getattr(res_usage, k, None) or 0
+    if logs.verbose(log):
+        log.debug(
+            "🔢 Tokens: %s in (%s cached), %s out",
+            res_usage.input_tokens, getattr(res_usage, "cache_read_input_tokens", None) or 0, res_usage.output_tokens,
+        )
+
+async def generate_replies(message: str, context: str, conversation_history: str = "", common_replies: list[str] = None) -> list[str]:
+    """
+    Generate reply suggestions using Claude.
+    
+    Args:
+        message: The current transcript/message heard
+        context: The conversation context (medical, restaurant, etc.)
+        conversation_history: Formatted string of past exchanges
+        common_replies: List of replies that have worked well in this context
+    """
+    if client is None:
+        raise RuntimeError("ANTHROPIC_API_KEY not set")
 
-Generate 9 appropriate replies the user could say next:"""
+    request = build_request(message, context, conversation_history, common_replies)
 
-    print(f"📝 Prompt being sent to Claude:\n{prompt}\n")
+    if logs.verbose(log):
+        log.debug("📝 Prompt being sent to Claude:\n%s", request["messages"][0]["content"])
 
-    res = client.messages.create(
-        model="claude-3-haiku-20240307",
-        max_tokens=350,
-        temperature=0.6,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    with metrics.span("llm"):
+        res = await client.messages.create(**request)
+    _record_usage(res.usage)
 
     text = res.content[0].text.strip()
     lines = _clean_lines(text)
@@ -96,3 +193,49 @@ Generate 9 appropriate replies the user could say next:"""
         raise ValueError(f"Claude returned <9 lines: {lines}")
 
     return lines[:9 ]
+
+async def stream_replies(message: str, context: str, conversation_history: str = "", common_replies: list[str] = None):
+    """
+    Stream reply suggestions from Claude, yielding each cleaned reply as soon
+    as its line is complete in the token stream. Yields at most 9 replies.
+
+    Takes the same arguments as generate_replies.
+    """
+    if client is None:
+        raise RuntimeError("ANTHROPIC_API_KEY not set")
+
+    request = build_request(message, context, conversation_history, common_replies)
+
+    if logs.verbose(log):
+        log.debug("📝 Prompt being streamed to Claude:\n%s", request["messages"][0]["content"])
+
+    t0 = time.perf_counter()
+    count = 0
+    buf = ""
+    async with client.messages.stream(**request) as stream:
+        try:
+            async for chunk in stream.text_stream:
+                buf += chunk
+                if "\n" not in buf:
+                    continue
+                # Everything before the last newline is complete lines
+                done, buf = buf.rsplit("\n", 1)
+                for line in _clean_lines(done):
+                    if count == 0:
+                        metrics.observe("ichack_stage_seconds", time.perf_counter() - t0, stage="llm_first_reply")
+                    yield line
+                    count += 1
+                    if count == 9:
+                        return
+        finally:
+            # Output tokens so far if we stopped early; nothing if the stream never started
+            try:
+                snapshot = stream.current_message_snapshot
+            except Exception:
+                snapshot = None
+            _record_usage(snapshot.usage if snapshot else None)
+            metrics.observe("ichack_stage_seconds", time.perf_counter() - t0, stage="llm_stream")
+
+    # Last line has no trailing newline
+    for line in _clean_lines(buf)[:9 - count]:
+        yield line
@@ -0,0 +1,46 @@
+import json
+import sqlite3
+import time
+
+from . import history
+from . import store
+
+# Offline conversion of the legacy JSON files into the SQLite databases.
+#
+# The server imports conversation_history.json and weights.json itself on its
+# first start, but that parses both files whole and folds every session into
+# the reply totals while other workers wait on the lock. Running this once
+# beforehand (with the same HISTORY_*/WEIGHTS_* environment as the server)
+# does that work up front, so the first start is as quick as any other.
+# Databases that already hold data are left as they are.
+#
+#   python -m backend.app.convert
+
+def _count(path: str, sql: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(sql).fetchone()[0]
+    finally:
+        conn.close()
+
+def main():
+    t0 = time.perf_counter()
+    history.load()
+    history.flush()
+    t1 = time.perf_counter()
+    store.load()
+    store.save()
+    t2 = time.perf_counter()
+
+    sessions = _count(history.HISTORY_DB, "SELECT COUNT(*) FROM sessions")
+    replies = _count(history.HISTORY_DB, "SELECT COUNT(*) FROM replies")
+    weights = _count(store.WEIGHTS_DB, "SELECT COUNT(*) FROM weights")
+    print(json.dumps({
+        "history": {"from": history.HISTORY_FILE, "to": history.HISTORY_DB,
+                    "sessions": sessions, "reply_totals": replies, "seconds": round(t1 - t0, 2)},
+        "weights": {"from": store.WEIGHTS_FILE, "to": store.WEIGHTS_DB,
+                    "rows": weights, "seconds": round(t2 - t1, 2)},
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,124 +1,680 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
 import json
 import os
-from datetime import datetime
-from collections import deque
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-HISTORY_FILE = "backend/app/conversation_history.json"
+from . import reply_index
+from . import metrics
+from .tokens import estimate_tokens
+
+HISTORY_FILE = os.getenv("HISTORY_FILE", "backend/app/conversation_history.json")  # legacy, imported once
+HISTORY_DB = os.getenv("HISTORY_DB", "backend/app/conversation_history.db")
 MAX_HISTORY_PER_SESSION = 20  # Keep last 20 exchanges per session
-MAX_CONTEXT_FOR_LLM = 10      # Send last 10 exchanges to LLM
+HISTORY_TOKEN_BUDGET = 300    # Approx. tokens of recent history sent to the LLM
+MAX_RESIDENT_SESSIONS = int(os.getenv("MAX_RESIDENT_SESSIONS", "10000"))  # sessions kept in memory
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))  # seconds idle before a session leaves memory
+COMPACT_EVERY = 2000          # Fold the journal into session snapshots after this many records
+COMPACT_KEEP_SECONDS = 60     # ...but leave records younger than this for workers still catching up
+COMPACT_BATCH = 200           # records folded per transaction, so the write lock is held for a few ms
+COMPACT_PAUSE = 0.02          # seconds between batches, so request writers get the lock
+BUSY_TIMEOUT_MS = 2000        # longest a history call waits on another writer before failing
+SYNC_INTERVAL = 5.0           # seconds between catch-ups when a worker gets no requests
 
-history = {}
+# Resident sessions, least recently used first. Anything else is loaded on
+# demand from its snapshot plus its journal records.
+history = OrderedDict()
+_last_used = {}  # session_id -> time.monotonic() of last access
 
-def load():
-    """Load conversation history from file."""
-    global history
-    if os.path.exists(HISTORY_FILE):
+# Everything after load() runs on one history thread (await run(fn, ...)),
+# so calls are serialized and waits on SQLite, such as another worker
+# holding the write lock, never block the event loop.
+#
+# Storage: every change is appended to a journal table as one small record
+# (session_id, op, ts, context, text) and committed before the request
+# returns, so with `uvicorn --workers N` the next request sees it whichever
+# worker gets it. Appends hold SQLite's write lock while they catch up with
+# the journal, apply the change and commit, so every worker sees each
+# session's changes in journal id order. Reads check PRAGMA data_version
+# first (no I/O when nothing changed) and catch up if another worker has
+# committed; catching up only patches sessions that are resident.
+#
+# Common replies are totals over every session, kept in the replies table
+# (context, reply, score, refs) and updated in the same transaction as the
+# journal append, so they stay right whichever sessions are in memory. Each
+# row carries the journal id that last changed it; catching up pulls the
+# changed rows into reply_index.
+#
+# Sessions leave memory when there are more than MAX_RESIDENT_SESSIONS or
+# they've been idle for SESSION_TTL. Every change is already on disk, so
+# eviction only drops the resident copy.
+#
+# A background thread folds old records into per-session snapshots once the
+# journal passes COMPACT_EVERY records, COMPACT_BATCH records per transaction
+# so requests (which commit on the event loop) never wait long for the write
+# lock. A worker that fell behind the fold drops its resident sessions and
+# reloads the reply totals.
+#
+# ops: "add" (context, transcript), "choose" (chosen_reply), "heard" (fingerprint),
+#      "clear", "clear_all"
+
+_conn = None          # this process's connection; opened at import, then used from the history thread only
+_applied = 0          # id of the last journal record reflected in memory
+_data_version = None
+_reply_epoch = None   # reply_index weights are scaled from this (meta.reply_epoch)
+_compactor = None
+_wake = threading.Event()
+_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    op TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    context TEXT,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS journal_session ON journal (session_id, id);
+CREATE INDEX IF NOT EXISTS journal_clear_all ON journal (id) WHERE op = 'clear_all';
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS replies (
+    context TEXT NOT NULL,
+    reply TEXT NOT NULL,
+    score REAL NOT NULL,
+    refs INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (context, reply)
+);
+CREATE INDEX IF NOT EXISTS replies_version ON replies (version);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('compacted_through', 0);
+"""
+
+REPLIES_UPSERT = """
+INSERT INTO replies (context, reply, score, refs, version) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (context, reply) DO UPDATE SET
+    score = score + excluded.score,
+    refs = refs + excluded.refs,
+    version = excluded.version
+"""
+
+async def run(fn, *args):
+    """Call a function of this module on the history thread and wait for it without blocking the loop."""
+    call = functools.partial(contextvars.copy_context().run, fn, *args)
+    return await asyncio.get_running_loop().run_in_executor(_thread, call)
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(HISTORY_DB) or ".", exist_ok=True)
+    # Opened on the importing thread, used on the history thread; never by two at once
+    conn = sqlite3.connect(HISTORY_DB, isolation_level=None, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # commits survive a crashed worker; fsync at checkpoint
+    conn.executescript(SCHEMA)
+    return conn
+
+def _meta(key: str, conn: sqlite3.Connection = None):
+    row = (conn or _conn).execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _apply(sessions: dict, session_id, op: str, ts: str, context, text):
+    """Apply one journal record to a dict of sessions. Shared by requests, replay and compaction."""
+    if op == "add":
+        if session_id not in sessions:
+            sessions[session_id] = {
+                "context": context,
+                "exchanges": [],
+                "created_at": ts,
+                "updated_at": ts
+            }
+        data = sessions[session_id]
+        data["exchanges"].append({
+            "timestamp": ts,
+            "transcript": text,
+            "chosen_reply": None
+        })
+        data["updated_at"] = ts
+        data["context"] = context  # Update context if changed
+
+        # Keep only the last N exchanges
+        if len(data["exchanges"]) > MAX_HISTORY_PER_SESSION:
+            data["exchanges"] = data["exchanges"][-MAX_HISTORY_PER_SESSION:]
+    elif op == "heard":
+        if session_id in sessions:
+            sessions[session_id]["heard"] = text
+    elif op == "choose":
+        if session_id in sessions and sessions[session_id]["exchanges"]:
+            sessions[session_id]["exchanges"][-1]["chosen_reply"] = text
+            sessions[session_id]["updated_at"] = ts
+    elif op == "clear":
+        sessions.pop(session_id, None)
+    elif op == "clear_all":
+        sessions.clear()
+
+def _evict():
+    """Drop least recently used sessions past MAX_RESIDENT_SESSIONS or idle past SESSION_TTL."""
+    cutoff = time.monotonic() - SESSION_TTL
+    while history:
+        oldest = next(iter(history))
+        if len(history) <= MAX_RESIDENT_SESSIONS and _last_used[oldest] > cutoff:
+            break
+        del history[oldest], _last_used[oldest]
+        metrics.inc("ichack_sessions_evicted_total")
+
+def _resident(session_id: str, data: dict):
+    history[session_id] = data
+    history.move_to_end(session_id)
+    _last_used[session_id] = time.monotonic()
+    _evict()
+
+def _session(session_id: str):
+    """A session's data, from memory or loaded from its snapshot and journal records. None if it doesn't exist."""
+    if session_id in history:
+        history.move_to_end(session_id)
+        _last_used[session_id] = time.monotonic()
+        return history[session_id]
+
+    with metrics.span("history_load"):
+        own_txn = not _conn.in_transaction
+        if own_txn:
+            _conn.execute("BEGIN")
+        try:
+            if _meta("compacted_through") > _applied:
+                behind = True
+            else:
+                behind = False
+                # A clear_all still in the journal voids every snapshot
+                cleared = _conn.execute(
+                    "SELECT MAX(id) FROM journal WHERE op = 'clear_all' AND id <= ?", (_applied,)
+                ).fetchone()[0]
+                row = None if cleared else _conn.execute(
+                    "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                rows = _conn.execute(
+                    "SELECT session_id, op, ts, context, text FROM journal "
+                    "WHERE session_id = ? AND id > ? AND id <= ? ORDER BY id",
+                    (session_id, cleared or 0, _applied),
+                ).fetchall()
+        finally:
+            if own_txn:
+                _conn.execute("COMMIT")
+    if behind:
+        # A compaction folded records we haven't seen into the snapshots
+        _catch_up()
+        return _session(session_id)
+
+    sessions = {session_id: json.loads(row[0])} if row else {}
+    for record in rows:
+        _apply(sessions, *record)
+    data = sessions.get(session_id)
+    if data is not None:
+        _resident(session_id, data)
+    return data
+
+def _read_changes():
+    """
+    Read what other workers committed since _applied (inside a transaction).
+
+    Returns (journal rows, changed reply totals, new _applied, whether we fell
+    behind a compaction and must drop everything resident).
+    """
+    behind = _meta("compacted_through") > _applied
+    since = -1 if behind else _applied
+    rows = [] if behind else _conn.execute(
+        "SELECT id, session_id, op, ts, context, text FROM journal WHERE id > ? ORDER BY id", (_applied,)
+    ).fetchall()
+    replies = _conn.execute(
+        "SELECT context, reply, score, refs FROM replies WHERE version > ?", (since,)
+    ).fetchall()
+    last = _conn.execute("SELECT MAX(id) FROM journal").fetchone()[0]
+    return rows, replies, max(last or 0, _meta("compacted_through"), _applied), behind
+
+def _apply_changes(rows, replies, last_id, behind):
+    global _applied
+    if behind:
+        # Every total was read: rebuild rather than patch
+        history.clear()
+        _last_used.clear()
+        reply_index.load(replies, _reply_epoch)
+        _applied = last_id
+        return
+    if any(op == "clear_all" for _, _, op, *_ in rows):
+        history.clear()
+        _last_used.clear()
+        reply_index.reset(_reply_epoch)
+    for row_id, session_id, op, ts, context, text in rows:
+        if session_id in history:
+            _apply(history, session_id, op, ts, context, text)
+            if session_id not in history:
+                del _last_used[session_id]
+    for context, reply, score, refs in replies:
+        reply_index.set_score(context, reply, score, refs)
+    _applied = last_id
+
+def _catch_up():
+    """Bring resident sessions and reply totals up to date with everything committed."""
+    _conn.execute("BEGIN")
+    try:
+        changes = _read_changes()
+    finally:
+        _conn.execute("COMMIT")
+    _apply_changes(*changes)
+
+def sync():
+    """Catch up with changes other workers have committed, if there are any, and evict idle sessions."""
+    global _data_version
+    version = _conn.execute("PRAGMA data_version").fetchone()[0]
+    if version != _data_version:
+        _data_version = version
+        _catch_up()
+    _evict()
+
+def _append(session_id, records: list[tuple]):
+    """Commit (op, context, text) records for one session (None for clear_all) and apply them."""
+    global _applied
+    ts = datetime.now().isoformat()
+    with metrics.span("persist_history"):
+        _conn.execute("BEGIN IMMEDIATE")  # no other worker can append until we commit
         try:
-            with open(HISTORY_FILE, "r") as f:
-                history = json.load(f)
-        except json.JSONDecodeError:
-            history = {}
+            _apply_changes(*_read_changes())
+            _conn.executemany(
+                "INSERT INTO journal (session_id, op, ts, context, text) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, op, ts, context, text) for op, context, text in records],
+            )
+            last_id = _conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+            if session_id is None:  # clear_all
+                _conn.execute("UPDATE replies SET score = 0, refs = 0, version = ?", (last_id,))
+                _conn.execute("COMMIT")
+                _apply_changes([], [], last_id, True)
+                return
+
+            data = _session(session_id)
+            before = reply_index.contributions(data)
+            # Work on a copy: memory only changes once the commit has succeeded
+            sessions = {session_id: json.loads(json.dumps(data))} if data else {}
+            for op, context, text in records:
+                _apply(sessions, session_id, op, ts, context, text)
+            data = sessions.get(session_id)
+            after = reply_index.contributions(data)
+            _conn.executemany(REPLIES_UPSERT, [
+                (context, reply, score, refs, last_id)
+                for (context, reply), (score, refs) in reply_index.changes(before, after).items()
+            ])
+            _conn.execute("COMMIT")
+        except Exception:
+            if _conn.in_transaction:
+                _conn.execute("ROLLBACK")
+            raise
+
+    # Committed: make memory match
+    if data is None:
+        history.pop(session_id, None)
+        _last_used.pop(session_id, None)
+    else:
+        _resident(session_id, data)
+    reply_index.update(before, after)
+    _applied = last_id
+    if last_id - _meta("compacted_through") >= COMPACT_EVERY:
+        _wake.set()
+
+def _import_legacy(conn: sqlite3.Connection):
+    """One-time import of the old whole-file JSON history into session snapshots."""
+    if not os.path.exists(HISTORY_FILE):
+        return
+    try:
+        with open(HISTORY_FILE, "r") as f:
+            legacy = json.load(f)
+    except json.JSONDecodeError:
+        return
+    conn.executemany(
+        "INSERT OR IGNORE INTO sessions (session_id, data) VALUES (?, ?)",
+        [(sid, json.dumps(data)) for sid, data in legacy.items()],
+    )
+
+def iter_sessions(limit: int = None):
+    """
+    Yield (session_id, data) for stored sessions, most recently written first,
+    without loading them all into memory. Used to build indexes at startup.
+    """
+    own_txn = not _conn.in_transaction
+    if own_txn:
+        _conn.execute("BEGIN")
+    try:
+        pending = {}
+        cleared = False
+        for _, session_id, op, ts, context, text in _conn.execute(
+            "SELECT id, session_id, op, ts, context, text FROM journal ORDER BY id"
+        ).fetchall():
+            if op == "clear_all":
+                pending.clear()
+                cleared = True
+            else:
+                pending.setdefault(session_id, []).append((session_id, op, ts, context, text))
+
+        n = 0
+        # Sessions with journal records first: they're the most recent
+        for session_id, records in reversed(list(pending.items())):
+            row = None if cleared else _conn.execute(
+                "SELECT data FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            sessions = {session_id: json.loads(row[0])} if row else {}
+            for record in records:
+                _apply(sessions, *record)
+            if session_id in sessions:
+                yield session_id, sessions[session_id]
+                n += 1
+                if limit is not None and n >= limit:
+                    return
+        if cleared:
+            return
+        # INSERT OR REPLACE on compaction gives rewritten snapshots new rowids
+        for session_id, data in _conn.execute("SELECT session_id, data FROM sessions ORDER BY rowid DESC"):
+            if session_id in pending:
+                continue
+            yield session_id, json.loads(data)
+            n += 1
+            if limit is not None and n >= limit:
+                return
+    finally:
+        if own_txn:
+            _conn.execute("COMMIT")
+
+def _build_replies():
+    """One-time fill of the replies table from every stored session (databases from before it existed)."""
+    totals = {}
+    for _, data in iter_sessions():
+        for key, (score, refs) in reply_index.changes(Counter(), reply_index.contributions(data)).items():
+            s, r = totals.get(key, (0.0, 0))
+            totals[key] = (s + score, r + refs)
+    return totals
+
+def load():
+    """Open the database, import legacy data once and load the reply totals. Sessions load on demand."""
+    global _conn, _data_version, _compactor, _reply_epoch, _applied
+    _conn = _connect()
+    _conn.execute("BEGIN IMMEDIATE")  # workers starting together import once
+    try:
+        empty = _conn.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM sessions) AND NOT EXISTS (SELECT 1 FROM journal)"
+        ).fetchone()[0]
+        if empty:
+            _import_legacy(_conn)
+        _conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('reply_epoch', ?)", (time.time(),))
+        _reply_epoch = _meta("reply_epoch")
+        reply_index.reset(_reply_epoch)
+        if _meta("replies_built") is None:
+            version = _conn.execute("SELECT COALESCE(MAX(id), 0) FROM journal").fetchone()[0]
+            _conn.executemany(
+                "INSERT INTO replies (context, reply, score, refs, version) VALUES (?, ?, ?, ?, ?)",
+                [(context, reply, score, refs, version) for (context, reply), (score, refs) in _build_replies().items()],
+            )
+            _conn.execute("INSERT INTO meta (key, value) VALUES ('replies_built', 1)")
+        _conn.execute("COMMIT")
+    except Exception:
+        if _conn.in_transaction:
+            _conn.execute("ROLLBACK")
+        raise
 
-def save():
-    """Save conversation history to file."""
-    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=2)
+    # Imports above may wait on another worker's; later calls give up sooner, as they queue on one thread
+    _conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    history.clear()
+    _last_used.clear()
+    _applied = -1  # behind everything: _catch_up loads every reply total
+    _data_version = _conn.execute("PRAGMA data_version").fetchone()[0]
+    _catch_up()
+
+    if _compactor is None or not _compactor.is_alive():
+        _compactor = threading.Thread(target=_compact_loop, name="history-compactor", daemon=True)
+        _compactor.start()
+
+def _compact_loop():
+    conn = _connect()
+    while True:
+        _wake.wait(COMPACT_KEEP_SECONDS)
+        _wake.clear()
+        pending = conn.execute("SELECT COALESCE(MAX(id), 0) FROM journal").fetchone()[0] - _meta("compacted_through", conn)
+        if pending >= COMPACT_EVERY:
+            try:
+                with metrics.span("compact_history"):
+                    _compact(conn)
+            except sqlite3.OperationalError:
+                pass  # another worker held the lock too long; next round
+
+def _compact(conn: sqlite3.Connection):
+    """Fold journal records older than COMPACT_KEEP_SECONDS into the session snapshots, a batch at a time."""
+    cutoff = (datetime.now() - timedelta(seconds=COMPACT_KEEP_SECONDS)).isoformat()
+    through = conn.execute("SELECT MAX(id) FROM journal WHERE ts < ?", (cutoff,)).fetchone()[0]
+    if through is None:
+        return
+    while _compact_batch(conn, through):
+        time.sleep(COMPACT_PAUSE)
+
+def _compact_batch(conn: sqlite3.Connection, through: int) -> bool:
+    """Fold the next COMPACT_BATCH records up to id `through` and delete them. False once that's all of them."""
+    conn.execute("BEGIN IMMEDIATE")  # one compaction at a time across workers
+    try:
+        done = _meta("compacted_through", conn)
+        records = conn.execute(
+            "SELECT id, session_id, op, ts, context, text FROM journal WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+            (done, through, COMPACT_BATCH),
+        ).fetchall()
+        if not records:
+            conn.execute("COMMIT")
+            return False
+        last_id = records[-1][0]
+        more = last_id < through
+
+        touched = {}
+        for _, session_id, op, ts, context, text in records:
+            if op == "clear_all":
+                conn.execute("DELETE FROM sessions")
+                touched = {}
+                continue
+            if session_id not in touched:
+                row = conn.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+                touched[session_id] = json.loads(row[0]) if row else None
+
+            sessions = {session_id: touched[session_id]} if touched[session_id] else {}
+            _apply(sessions, session_id, op, ts, context, text)
+            touched[session_id] = sessions.get(session_id)
+
+        for session_id, data in touched.items():
+            if data is None:
+                conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, data) VALUES (?, ?)",
+                    (session_id, json.dumps(data)),
+                )
+        conn.execute("DELETE FROM journal WHERE id <= ?", (last_id,))
+        if not more:
+            # Replies nobody has chosen any more; workers behind this point reload all totals anyway
+            conn.execute("DELETE FROM replies WHERE refs <= 0 AND version <= ?", (last_id,))
+        conn.execute("UPDATE meta SET value = ? WHERE key = 'compacted_through'", (last_id,))
+        conn.execute("COMMIT")
+        return more
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+def flush():
+    """Changes are committed as they're made; checkpoint the WAL so they're in the main file too."""
+    if _conn is not None:
+        _conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+# The frontend sends the whole transcript so far on every request. Sessions keep
+# a fingerprint ("<word count>:<hash>") of the transcript they've already heard,
+# so only the words after it are stored and sent to the LLM.
+
+def _norm(word: str) -> str:
+    return re.sub(r"[^\w£']", "", word.lower())
+
+def _fingerprint(words: list[str]) -> str:
+    return f"{len(words)}:{hashlib.blake2b(' '.join(words).encode(), digest_size=8).hexdigest()}"
+
+def _split_new(data: dict, transcript: str) -> tuple[list[str], str, bool]:
+    """
+    Split a cumulative transcript against what the session has already heard.
+
+    Returns (new words, fingerprint of the transcript, whether it is a repeat).
+    """
+    words = transcript.split()
+    norm = [_norm(w) for w in words]
+    fingerprint = _fingerprint(norm)
+    if not data:
+        return words, fingerprint, False
+
+    heard = data.get("heard")
+    if heard is None and data["exchanges"]:
+        # Sessions recorded before diffing stored full transcripts
+        heard = _fingerprint([_norm(w) for w in (data["exchanges"][-1]["transcript"] or "").split()])
+    if heard == fingerprint:
+        return [], fingerprint, True
+
+    if heard:
+        n = int(heard.split(":")[0])
+        if n <= len(norm) and _fingerprint(norm[:n]) == heard:
+            words, norm = words[n:], norm[n:]
+        # otherwise the transcript was reset or revised: treat it all as new
+
+    # The user's spoken reply comes back in the transcript; it's already in history
+    chosen = data["exchanges"][-1]["chosen_reply"] if data["exchanges"] else None
+    if chosen:
+        chosen_norm = [_norm(w) for w in chosen.split()]
+        if norm[:len(chosen_norm)] == chosen_norm:
+            words = words[len(chosen_norm):]
+
+    return words, fingerprint, False
+
+def new_speech(session_id: str, transcript: str) -> str:
+    """
+    Return the part of a cumulative transcript this session hasn't heard yet.
+
+    A repeat of the last transcript (double tap, recognition restart) returns
+    the last exchange's transcript so it gets the same suggestions.
+    """
+    sync()
+    data = _session(session_id)
+    words, _, repeat = _split_new(data, transcript)
+    if repeat:
+        return data["exchanges"][-1]["transcript"] if data["exchanges"] else ""
+    return " ".join(words)
 
 def add_exchange(session_id: str, context: str, transcript: str, chosen_reply: str = None):
     """
     Add a conversation exchange to history.
+
+    Only the speech not already heard in this session is stored; an exact
+    repeat of the last transcript adds nothing.
     
     Args:
         session_id: Unique session identifier
         context: Conversation context (medical, restaurant, etc.)
-        transcript: What was heard/spoken
+        transcript: What was heard/spoken (may be cumulative)
         chosen_reply: The reply the user selected (if any)
     """
-    if session_id not in history:
-        history[session_id] = {
-            "context": context,
-            "exchanges": [],
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
-    
-    exchange = {
-        "timestamp": datetime.now().isoformat(),
-        "transcript": transcript,
-        "chosen_reply": chosen_reply
-    }
-    
-    history[session_id]["exchanges"].append(exchange)
-    history[session_id]["updated_at"] = datetime.now().isoformat()
-    history[session_id]["context"] = context  # Update context if changed
-    
-    # Keep only the last N exchanges
-    if len(history[session_id]["exchanges"]) > MAX_HISTORY_PER_SESSION:
-        history[session_id]["exchanges"] = history[session_id]["exchanges"][-MAX_HISTORY_PER_SESSION:]
-    
-    save()
+    sync()
+    data = _session(session_id)
+    words, fingerprint, repeat = _split_new(data, transcript)
+    if repeat:
+        return
+    records = []
+    if words:
+        records.append(("add", context, " ".join(words)))
+        if chosen_reply:
+            records.append(("choose", None, chosen_reply))
+    if words or data is not None:
+        records.append(("heard", None, fingerprint))
+    if records:
+        _append(session_id, records)
+
+def update_last_exchange_with_choice(session_id: str, chosen_reply: str) -> bool:
+    """Update the most recent exchange with the user's chosen reply. False if the session has none."""
+    sync()
+    data = _session(session_id)
+    if not (data and data["exchanges"]):
+        return False
+    _append(session_id, [("choose", None, chosen_reply)])
+    return True
 
-def update_last_exchange_with_choice(session_id: str, chosen_reply: str):
-    """Update the most recent exchange with the user's chosen reply."""
-    if session_id in history and history[session_id]["exchanges"]:
-        history[session_id]["exchanges"][-1]["chosen_reply"] = chosen_reply
-        history[session_id]["updated_at"] = datetime.now().isoformat()
-        save()
+def get_last_transcript(session_id: str) -> str:
+    """Transcript of the session's most recent exchange, or "" if there is none."""
+    sync()
+    data = _session(session_id)
+    if not data or not data["exchanges"]:
+        return ""
+    return data["exchanges"][-1]["transcript"] or ""
 
-def get_history_for_llm(session_id: str, max_exchanges: int = None) -> str:
+def get_history_for_llm(session_id: str, max_exchanges: int = None, max_tokens: int = None) -> str:
     """
     Get formatted conversation history for the LLM prompt.
+
+    Takes the most recent exchanges that fit in max_tokens
+    (HISTORY_TOKEN_BUDGET by default), optionally capped at max_exchanges.
     
     Returns a string formatted for the LLM to understand the conversation flow.
     """
-    if max_exchanges is None:
-        max_exchanges = MAX_CONTEXT_FOR_LLM
-        
-    if session_id not in history:
+    if max_tokens is None:
+        max_tokens = HISTORY_TOKEN_BUDGET
+
+    sync()
+    data = _session(session_id)
+    if data is None:
         return ""
     
-    exchanges = history[session_id]["exchanges"][-max_exchanges:]
+    exchanges = data["exchanges"]
+    if max_exchanges is not None:
+        exchanges = exchanges[-max_exchanges:]
     
     if not exchanges:
         return ""
     
-    formatted_lines = []
-    for ex in exchanges:
+    # Walk back from the newest exchange until the budget is spent
+    blocks = []
+    used = 0
+    for ex in reversed(exchanges):
+        lines = []
         if ex.get("transcript"):
-            formatted_lines.append(f"[Heard]: {ex['transcript']}")
+            lines.append(f"[Heard]: {ex['transcript']}")
         if ex.get("chosen_reply"):
-            formatted_lines.append(f"[User replied]: {ex['chosen_reply']}")
+            lines.append(f"[User replied]: {ex['chosen_reply']}")
+        cost = sum(estimate_tokens(line) + 1 for line in lines)
+        if used + cost > max_tokens:
+            break
+        blocks.append(lines)
+        used += cost
     
-    return "\n".join(formatted_lines)
+    return "\n".join(line for lines in reversed(blocks) for line in lines)
 
 def get_common_replies(context: str, limit: int = 10) -> list[str]:
     """
     Get the most commonly chosen replies across all sessions for a given context.
     This helps the LLM learn what replies work well.
+
+    Served from reply_index in O(limit) rather than by scanning history.
     """
-    reply_counts = {}
-    
-    for session_id, data in history.items():
-        if data.get("context") != context:
-            continue
-        for ex in data.get("exchanges", []):
-            reply = ex.get("chosen_reply")
-            if reply:
-                reply_counts[reply] = reply_counts.get(reply, 0) + 1
-    
-    # Sort by count and return top replies
-    sorted_replies = sorted(reply_counts.items(), key=lambda x: x[1], reverse=True)
-    return [reply for reply, count in sorted_replies[:limit]]
+    sync()
+    return reply_index.top(context, limit)
 
 def clear_session(session_id: str):
     """Clear history for a specific session."""
-    if session_id in history:
-        del history[session_id]
-        save()
+    sync()
+    if _session(session_id) is not None:
+        _append(session_id, [("clear", None, None)])
 
 def clear_all():
     """Clear all conversation history."""
-    global history
-    history = {}
-    save()
+    _append(None, [("clear_all", None, None)])
@@ -0,0 +1,103 @@
+import asyncio
+import itertools
+import logging
+
+from . import cache
+
+log = logging.getLogger(__name__)
+
+# Live suggestions over a WebSocket (/suggest/live). Each connection has at
+# most one pending update: interim transcripts wait DEBOUNCE seconds and a
+# newer message replaces them, and finals run at once. A newer update cancels
+# the previous one, even if that one is already waiting on the LLM. The LLM
+# call it started is held per connection and is cancelled once a newer update
+# needs different replies. An interim and its final usually have the same
+# key, so the final reuses the interim's call.
+#
+# State is per connection, (session_id, n), so two sockets for one session
+# (two tabs, or a reconnect before the old socket is closed) don't cancel
+# each other's updates.
+
+DEBOUNCE = 0.3  # seconds an interim transcript waits for a newer one before it is sent
+
+_updates = {}  # connection -> {"task", "started"} for the latest update
+_held = {}     # connection -> (cache key, generation task) of the latest LLM call
+_ids = itertools.count()
+
+stats = {"connections": 0, "updates": 0, "debounced": 0, "superseded": 0}
+
+def connect(session_id: str) -> tuple:
+    """A new connection's key for the functions below."""
+    stats["connections"] += 1
+    return session_id, next(_ids)
+
+def schedule(conn: tuple, delay: float, update):
+    """
+    Run update() after `delay` seconds, replacing the connection's pending update.
+
+    Args:
+        conn: Connection the update is for, from connect()
+        delay: Seconds to wait first (DEBOUNCE for interim transcripts, 0 for finals)
+        update: Zero-argument coroutine function that computes and pushes suggestions
+    """
+    cancel(conn)
+    slot = {"started": False}
+
+    async def run():
+        await asyncio.sleep(delay)
+        slot["started"] = True
+        stats["updates"] += 1
+        try:
+            await update()
+        except Exception as e:
+            # Typically the socket closed mid-push; nothing else is waiting on this task
+            log.warning("❌ Live update failed: %r", e)
+
+    slot["task"] = asyncio.ensure_future(run())
+    _updates[conn] = slot
+
+def cancel(conn: tuple):
+    """Cancel the connection's pending update, if any. The LLM call it holds stays until release()."""
+    slot = _updates.pop(conn, None)
+    if slot is None or slot["task"].done():
+        return
+    slot["task"].cancel()
+    stats["superseded" if slot["started"] else "debounced"] += 1
+
+def release(conn: tuple, keep=None):
+    """Let go of the connection's LLM call unless it is for `keep`; cache cancels it if nobody else waits."""
+    held = _held.get(conn)
+    if held is None or held[0] == keep:
+        return
+    del _held[conn]
+    cache.release(*held)
+
+async def replies(conn: tuple, key, generate) -> list[str]:
+    """
+    Replies for the connection's latest update, reusing its running call for
+    the same key. Any other call the connection holds is released.
+
+    Args:
+        conn: Connection the update is for, from connect()
+        key: Key from cache.make_key
+        generate: Zero-argument coroutine function returning a list of replies
+    """
+    release(conn, keep=key)
+    held = _held.get(conn)
+    if held is None or held[1].done():
+        if held is not None:
+            cache.release(*held)
+        held = _held[conn] = (key, cache.acquire(key, generate))
+    return list(await asyncio.shield(held[1]))
+
+def close(conn: tuple):
+    cancel(conn)
+    release(conn)
+
+def close_session(session_id: str):
+    """Close every connection of a session (its history was cleared)."""
+    for conn in [c for c in {*_updates, *_held} if c[0] == session_id]:
+        close(conn)
+
+def get_stats() -> dict:
+    return {**stats, "pending": sum(1 for slot in _updates.values() if not slot["task"].done()), "held": len(_held)}
@@ -0,0 +1,28 @@
+import contextvars
+import logging
+import os
+import random
+
+# Level-controlled, sampled logging. Routine per-request detail (transcripts,
+# prompts, history, replies) is logged at DEBUG and only for a sampled
+# fraction of requests; warnings and errors are always logged.
+#
+#   LOG_LEVEL=DEBUG LOG_SAMPLE_RATE=1   log every request in full (local dev)
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+
+_sampled = contextvars.ContextVar("log_sampled", default=False)
+
+def setup():
+    # LOG_LEVEL applies to this app's loggers; libraries (httpx logs every request at INFO) stay at WARNING
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger(__package__).setLevel(LOG_LEVEL)
+
+def start_request():
+    """Decide once per request whether its detail gets logged; tasks it spawns inherit the decision."""
+    _sampled.set(random.random() < LOG_SAMPLE_RATE)
+
+def verbose(logger: logging.Logger) -> bool:
+    """True if this request is sampled and the logger would emit DEBUG."""
+    return _sampled.get() and logger.isEnabledFor(logging.DEBUG)
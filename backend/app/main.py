@@ -1,17 +1,44 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from .routes import router
+from . import claude
 from . import store
 from . import history
+from . import retrieval
+from . import logs
+from . import metrics
 
+logs.setup()
 store.load()
 history.load()
+retrieval.build(data for _, data in history.iter_sessions(retrieval.BUILD_SESSIONS))
+
+async def _sync_history():
+    # Keep an idle worker close to the journal so it never falls behind compaction
+    while True:
+        await asyncio.sleep(history.SYNC_INTERVAL)
+        await history.run(history.sync)
 
-app = FastAPI(title="ichack2026-backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled Anthropic client for the whole process
+    claude.init_client()
+    syncer = asyncio.create_task(_sync_history())
+    yield
+    syncer.cancel()
+    await claude.close_client()
+    await history.run(history.flush)
+    store.save()
+
+app = FastAPI(title="ichack2026-backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,6 +50,16 @@ app.add_middleware(
 
 app.include_router(router)
 
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    # Route template rather than raw path, so labels stay bounded
+    route = request.scope.get("route")
+    metrics.observe("ichack_request_seconds", time.perf_counter() - t0,
+                    route=route.path if route else "unmatched", method=request.method)
+    return response
+
 @app.get("/health")
 def health():
     return {"ok": True}
@@ -0,0 +1,85 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage timings as Prometheus histograms, plus counters. Rendered in the text
+# exposition format by GET /metrics. Spans are recorded from the event loop,
+# the history thread and the weights flusher thread, so updates take a lock.
+
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "ichack_stage_seconds": "Time spent in each stage of request handling and persistence",
+    "ichack_request_seconds": "HTTP request latency by route",
+    "ichack_live_push_seconds": "Time from a live transcript message to each push it produced",
+    "ichack_fallbacks_total": "Suggestions served from local retrieval instead of the LLM, by reason",
+}
+
+# name -> labels (tuple of (key, value)) -> [bucket counts..., sum, count]
+_histograms = {}
+# name -> labels -> value
+_counters = {}
+_lock = threading.Lock()
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+def observe(name: str, seconds: float, **labels):
+    with _lock:
+        h = _histograms.setdefault(name, {}).setdefault(_labels(labels), [0] * (len(BUCKETS) + 2))
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                h[i] += 1
+        h[-2] += seconds
+        h[-1] += 1
+
+def inc(name: str, value: float = 1, **labels):
+    with _lock:
+        series = _counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+
+@contextmanager
+def span(stage: str):
+    """Time a block into ichack_stage_seconds{stage=...}."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("ichack_stage_seconds", time.perf_counter() - t0, stage=stage)
+
+def _fmt(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+def render(external: list[tuple] = ()) -> str:
+    """
+    Prometheus text format for everything recorded here, plus `external`
+    series kept elsewhere: (name, type, help, {labels dict tuple: value}).
+    """
+    out = []
+    with _lock:
+        for name, series in sorted(_histograms.items()):
+            out.append(f"# HELP {name} {HELP.get(name, name)}")
+            out.append(f"# TYPE {name} histogram")
+            for labels, h in sorted(series.items()):
+                for bound, n in zip(BUCKETS, h):
+                    out.append(f"{name}_bucket{_fmt(labels, (('le', repr(bound)),))} {n}")
+                out.append(f"{name}_bucket{_fmt(labels, (('le', '+Inf'),))} {h[-1]}")
+                out.append(f"{name}_sum{_fmt(labels)} {h[-2]}")
+                out.append(f"{name}_count{_fmt(labels)} {h[-1]}")
+        counters = [(name, "counter", HELP.get(name, name), dict(series)) for name, series in sorted(_counters.items())]
+
+    for name, kind, help_text, series in counters + list(external):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        for labels, value in series.items():
+            out.append(f"{name}{_fmt(labels)} {value}")
+    return "\n".join(out) + "\n"
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
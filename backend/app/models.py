@@ -1,11 +1,12 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class SuggestReq(BaseModel):
     session_id: str
     last_text: str
     context: Optional[str] = "generic"
-    mode: Optional[str] = "default"
+    mode: Optional[str] = "default"  # "fast": local retrieval only, no LLM
+    budget_ms: Optional[int] = None  # how long to wait for the LLM; server default if unset
 
 class SuggestItem(BaseModel):
     id: str
@@ -25,3 +26,9 @@ class LogChoiceReq(BaseModel):
 
 class ClearHistoryReq(BaseModel):
     session_id: str
+
+class LiveUpdate(BaseModel):
+    type: Literal["interim", "final"]
+    text: str  # cumulative transcript, interim words included
+    context: Optional[str] = None  # defaults to the socket's context
+    mode: Optional[str] = "default"
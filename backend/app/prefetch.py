@@ -0,0 +1,113 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+# Speculative next-turn suggestions. When the user taps a reply, /log_choice
+# starts generating suggestions for the next turn in the background. The
+# result waits in a per-session slot; the next /suggest uses it if the
+# conversation hasn't moved on and what was heard since is short and generic
+# (e.g. "Sure, anything else?"). Anything more specific gets fresh replies.
+# Slots of sessions that never ask again expire after PREFETCH_TTL.
+
+PREFETCH_CONCURRENCY = 4  # background generations allowed at once; extra ones are skipped
+PREFETCH_TTL = 60.0       # seconds a prefetched result stays usable
+PREFETCH_MAX_WORDS = 6    # new speech longer than this is too specific for a prefetch
+PREFETCH_MAX_SLOTS = 1000 # slots kept at once; the oldest go first
+
+_slots = OrderedDict()  # session_id -> {"task", "context", "history", "created"}, oldest first
+_running = set()        # generation tasks not finished yet
+
+stats = {"started": 0, "skipped": 0, "hits": 0, "misses": 0, "cancelled": 0, "expired": 0}
+
+def _drop(slot: dict):
+    if not slot["task"].done():
+        slot["task"].cancel()
+        stats["cancelled"] += 1
+
+def _sweep():
+    """Evict slots past PREFETCH_TTL (sessions that never asked again) and any over PREFETCH_MAX_SLOTS."""
+    now = time.monotonic()
+    while _slots:
+        slot = next(iter(_slots.values()))
+        if now - slot["created"] < PREFETCH_TTL and len(_slots) <= PREFETCH_MAX_SLOTS:
+            break
+        _slots.popitem(last=False)
+        _drop(slot)
+        stats["expired"] += 1
+
+def _finished(task: asyncio.Task):
+    _running.discard(task)
+    # Failures only matter if someone takes the slot; retrieve them so they aren't logged
+    if not task.cancelled():
+        task.exception()
+
+def cancel(session_id: str):
+    """Drop a session's slot, cancelling its generation if still running."""
+    slot = _slots.pop(session_id, None)
+    if slot:
+        _drop(slot)
+
+def start(session_id: str, context: str, conversation_history: str, generate):
+    """
+    Start generating next-turn suggestions for a session in the background.
+
+    Args:
+        session_id: Session the suggestions are for
+        context: Conversation context at the time of the choice
+        conversation_history: History window the suggestions are based on
+        generate: Zero-argument coroutine function returning a list of replies
+    """
+    cancel(session_id)
+    if len(_running) >= PREFETCH_CONCURRENCY:
+        stats["skipped"] += 1
+        return
+
+    task = asyncio.ensure_future(generate())
+    _running.add(task)
+    task.add_done_callback(_finished)
+    _slots[session_id] = {
+        "task": task,
+        "context": context,
+        "history": conversation_history,
+        "created": time.monotonic(),
+    }
+    stats["started"] += 1
+    _sweep()
+
+def take(session_id: str, context: str, conversation_history: str, text: str, intent: str):
+    """
+    Claim the session's prefetched suggestions if they fit this request.
+
+    Returns the generation task (possibly still running) or None. The slot is
+    emptied either way; a prefetch that doesn't fit is cancelled.
+    """
+    slot = _slots.pop(session_id, None)
+    if slot is None:
+        return None
+
+    task = slot["task"]
+    fits = (
+        slot["context"] == context
+        and slot["history"] == conversation_history
+        and time.monotonic() - slot["created"] < PREFETCH_TTL
+        and intent == "generic"
+        and len(text.split()) <= PREFETCH_MAX_WORDS
+        and not (task.done() and (task.cancelled() or task.exception() is not None))
+    )
+    if not fits:
+        _drop(slot)
+        stats["misses"] += 1
+        return None
+
+    stats["hits"] += 1
+    return task
+
+def get_stats() -> dict:
+    _sweep()
+    taken = stats["hits"] + stats["misses"]
+    return {
+        **stats,
+        "slots": len(_slots),
+        "running": len(_running),
+        "hit_rate": round(stats["hits"] / taken, 3) if taken else None,
+    }
@@ -0,0 +1,135 @@
+import bisect
+import time
+from collections import Counter
+from datetime import datetime
+
+# Per-context ranking of chosen replies, kept up to date as history changes so
+# get_common_replies doesn't walk every session on every /suggest.
+#
+# Set HALF_LIFE_DAYS to rank recently popular replies higher: each choice then
+# counts 2 ** ((t - epoch) / half_life) instead of 1. Scaling new choices up
+# rather than decaying old ones down gives the same order without rescoring.
+HALF_LIFE_DAYS = None
+
+_epoch = time.time()
+index = {}  # context -> _Ranked
+
+class _Ranked:
+    """Replies kept sorted by score (highest first) with O(1) position lookup."""
+
+    def __init__(self):
+        self.items = []   # replies, highest score first
+        self.pos = {}     # reply -> index into items
+        self.score = {}   # reply -> score
+        self.refs = {}    # reply -> number of choices behind the score
+
+    def _key(self, reply):
+        return -self.score[reply]
+
+    def _move(self, i: int, j: int, old: float):
+        """Move items[i] to index j, shifting the items in between by one."""
+        if i == j:
+            return
+        lo, hi = min(i, j), max(i, j)
+        adjacent = i + 1 if j > i else i - 1
+        if self.score[self.items[j]] == old and self.score[self.items[adjacent]] == old:
+            # Everything in between ties on the old score: one swap keeps the order
+            self.items[i], self.items[j] = self.items[j], self.items[i]
+            self.pos[self.items[i]] = i
+            self.pos[self.items[j]] = j
+            return
+        item = self.items.pop(i)
+        self.items.insert(j, item)
+        for k in range(lo, hi + 1):
+            self.pos[self.items[k]] = k
+
+    def add(self, reply: str, delta: float, refs: int):
+        if reply not in self.pos:
+            self.pos[reply] = len(self.items)
+            self.items.append(reply)
+            self.score[reply] = 0.0
+            self.refs[reply] = 0
+
+        old = self.score[reply]
+        new = old + delta
+        self.score[reply] = new
+        self.refs[reply] += refs
+        i = self.pos[reply]
+
+        if self.refs[reply] <= 0:
+            self._move(i, len(self.items) - 1, old)
+            self.items.pop()
+            del self.pos[reply], self.score[reply], self.refs[reply]
+            return
+
+        if new > old:
+            # First index scoring below the new score
+            j = bisect.bisect_right(self.items, -new, 0, i, key=self._key)
+            self._move(i, j, old)
+        elif new < old:
+            # Last index still scoring above the new score
+            j = bisect.bisect_left(self.items, -new, i + 1, len(self.items), key=self._key) - 1
+            self._move(i, j, old)
+
+    def top(self, k: int) -> list[str]:
+        return self.items[:k]
+
+def weight(ts: str) -> float:
+    if HALF_LIFE_DAYS is None:
+        return 1.0
+    t = datetime.fromisoformat(ts).timestamp()
+    return 2.0 ** ((t - _epoch) / (HALF_LIFE_DAYS * 86400))
+
+def contributions(data: dict) -> Counter:
+    """Chosen replies a session contributes, as (context, reply, timestamp) counts."""
+    if not data:
+        return Counter()
+    return Counter(
+        (data.get("context"), ex["chosen_reply"], ex["timestamp"])
+        for ex in data.get("exchanges", [])
+        if ex.get("chosen_reply")
+    )
+
+def changes(before: Counter, after: Counter) -> dict:
+    """(context, reply) -> (score delta, refs delta) between a session's contributions before and after a change."""
+    out = {}
+    for diff, sign in ((after - before, 1), (before - after, -1)):
+        for (context, reply, ts), n in diff.items():
+            score, refs = out.get((context, reply), (0.0, 0))
+            out[(context, reply)] = (score + sign * weight(ts) * n, refs + sign * n)
+    return out
+
+def update(before: Counter, after: Counter):
+    """Apply the difference between a session's contributions before and after a change."""
+    for (context, reply), (score, refs) in changes(before, after).items():
+        index.setdefault(context, _Ranked()).add(reply, score, refs)
+
+def set_score(context: str, reply: str, score: float, refs: int):
+    """Overwrite a reply's score and choice count, e.g. with the totals another worker wrote."""
+    ranked = index.setdefault(context, _Ranked())
+    ranked.add(reply, score - ranked.score.get(reply, 0.0), refs - ranked.refs.get(reply, 0))
+
+def load(rows, epoch: float):
+    """Replace the index with (context, reply, score, refs) totals, sorting each context once."""
+    reset(epoch)
+    by_context = {}
+    for context, reply, score, refs in rows:
+        if refs > 0:
+            by_context.setdefault(context, []).append((score, reply, refs))
+    for context, entries in by_context.items():
+        entries.sort(key=lambda e: -e[0])
+        ranked = index[context] = _Ranked()
+        ranked.items = [reply for _, reply, _ in entries]
+        ranked.pos = {reply: i for i, reply in enumerate(ranked.items)}
+        ranked.score = {reply: score for score, reply, _ in entries}
+        ranked.refs = {reply: refs for _, reply, refs in entries}
+
+def top(context: str, k: int) -> list[str]:
+    ranked = index.get(context)
+    return ranked.top(k) if ranked else []
+
+def reset(epoch: float = None):
+    """Empty the index; scores added afterwards are scaled from `epoch` (now by default)."""
+    global _epoch
+    index.clear()
+    _epoch = time.time() if epoch is None else epoch
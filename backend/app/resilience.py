@@ -0,0 +1,114 @@
+import asyncio
+import time
+from collections import deque
+
+# Guards around LLM calls:
+#   - a latency budget per /suggest (enforced in routes), after which the user
+#     gets local suggestions while the call carries on and fills the cache
+#   - hedging: if the first call is slower than the recent p95, fire a second
+#     one and take whichever answers first
+#   - a circuit breaker: after BREAKER_FAILURES consecutive failures, skip the
+#     LLM for BREAKER_COOLDOWN seconds, then let a single probe call through
+
+LATENCY_BUDGET = 2.5        # seconds /suggest waits for the LLM by default
+HEDGING = True
+HEDGE_PERCENTILE = 0.95     # hedge once the first call is slower than this percentile
+HEDGE_MIN_SAMPLES = 20      # ...of at least this many recent successful calls
+BREAKER_FAILURES = 5        # consecutive failures that open the breaker
+BREAKER_COOLDOWN = 30.0     # seconds the LLM is skipped once the breaker opens
+
+_latencies = deque(maxlen=200)  # recent successful call latencies, seconds
+breaker = {"failures": 0, "open_until": 0.0, "probing": False}
+stats = {"calls": 0, "failures": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0, "short_circuits": 0}
+
+class CircuitOpen(RuntimeError):
+    pass
+
+def hedge_delay():
+    """Seconds to wait before hedging, or None if hedging is off or there is too little data."""
+    if not HEDGING or len(_latencies) < HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(_latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE))]
+
+def is_open() -> bool:
+    return breaker["failures"] >= BREAKER_FAILURES and time.monotonic() < breaker["open_until"]
+
+def allow() -> bool:
+    """Whether an LLM call may go out now. After the cool-down only one probe is let through."""
+    if breaker["failures"] < BREAKER_FAILURES:
+        return True
+    if time.monotonic() < breaker["open_until"] or breaker["probing"]:
+        return False
+    breaker["probing"] = True
+    return True
+
+def release_probe():
+    """Free the probe slot when a call is abandoned without an outcome."""
+    breaker["probing"] = False
+
+def record_success(latency: float):
+    _latencies.append(latency)
+    breaker["failures"] = 0
+    breaker["probing"] = False
+
+def record_failure():
+    stats["failures"] += 1
+    breaker["failures"] += 1
+    breaker["probing"] = False
+    if breaker["failures"] >= BREAKER_FAILURES:
+        breaker["open_until"] = time.monotonic() + BREAKER_COOLDOWN
+
+async def call(generate):
+    """
+    Run generate() under the circuit breaker, hedging with a second call if
+    the first is slow. Raises CircuitOpen without calling out when the
+    breaker is open.
+
+    Args:
+        generate: Zero-argument coroutine function making one LLM call
+    """
+    if not allow():
+        stats["short_circuits"] += 1
+        raise CircuitOpen("LLM circuit breaker open")
+
+    stats["calls"] += 1
+    t0 = time.monotonic()
+    first = asyncio.ensure_future(generate())
+    tasks = {first}
+    error = None
+    try:
+        delay = hedge_delay()
+        if delay is not None:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                stats["hedges"] += 1
+                tasks.add(asyncio.ensure_future(generate()))
+
+        # First successful answer wins; fail only when every attempt has failed
+        while tasks:
+            done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    record_success(time.monotonic() - t0)
+                    if task is not first:
+                        stats["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+
+        record_failure()
+        raise error
+    except asyncio.CancelledError:
+        release_probe()
+        raise
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def get_stats() -> dict:
+    return {
+        **stats,
+        "breaker_open": is_open(),
+        "consecutive_failures": breaker["failures"],
+        "hedge_after_ms": round(hedge_delay() * 1000) if hedge_delay() is not None else None,
+    }
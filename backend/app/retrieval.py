@@ -0,0 +1,155 @@
+import math
+import re
+from collections import defaultdict
+
+from .intents import classify_intent
+from .phrasepacks import PHRASEPACKS
+from . import store
+from . import reply_index
+
+# Local, LLM-free suggestion engine.
+#
+# Every known reply (phrasepacks, replies chosen in history, replies with
+# learned weights) is a document. A document's text is the reply itself plus
+# "cues": transcripts that were heard right before the reply was chosen. Text
+# is broken into character trigrams and kept in an inverted index, so a query
+# only touches documents that share a trigram with it. A document's score is
+# the summed IDF of the trigrams it shares with the query, divided by
+# sqrt(its trigram count) * sqrt(the query's): binary trigram sets with each
+# shared trigram weighted by IDF. The norms ignore IDF, which changes as
+# documents are added, so they never need recomputing.
+
+MAX_CUES = 20           # cue transcripts remembered per reply
+CANDIDATES = 50         # best-matching documents considered for final ranking
+COMMON_GRAM_RATIO = 0.2 # skip trigrams found in more than a fifth of the documents
+BUILD_SESSIONS = 5000   # most recent sessions whose choices are indexed with their cues at startup
+
+INTENT_BONUS = 0.2      # reply belongs to the phrasepack of the classified intent
+CONTEXT_BONUS = 0.1     # reply has been chosen before in this context
+WEIGHT_BONUS = 0.1      # times log(1 + learned weight)
+
+docs = []               # doc id -> {"text", "grams", "norm", "packs", "contexts", "intents", "cues"}
+_by_text = {}           # reply text -> doc id
+_postings = defaultdict(set)  # trigram -> doc ids
+
+def _grams(text: str) -> set[str]:
+    text = " " + " ".join(re.sub(r"[^\w£']", " ", text.lower()).split()) + " "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _idf(gram: str) -> float:
+    return math.log((1 + len(docs)) / (1 + len(_postings.get(gram, ()))))
+
+def _reindex(doc_id: int, grams: set[str]):
+    doc = docs[doc_id]
+    for g in grams - doc["grams"]:
+        _postings[g].add(doc_id)
+    doc["grams"] |= grams
+    doc["norm"] = math.sqrt(len(doc["grams"]))  # binary norm; IDF only weights the overlap
+
+def _doc(reply: str) -> int:
+    """Doc id of a reply, indexing it first if it is new."""
+    doc_id = _by_text.get(reply)
+    if doc_id is None:
+        doc_id = len(docs)
+        docs.append({"text": reply, "grams": set(), "norm": 0.0, "packs": set(), "contexts": set(), "intents": set(), "cues": []})
+        _by_text[reply] = doc_id
+        _reindex(doc_id, _grams(reply))
+    return doc_id
+
+def add(context: str, intent: str, reply: str, cue: str = "", pack: bool = False):
+    """
+    Index a reply, or add a context/intent/cue to one already indexed.
+
+    pack marks a phrasepack reply: usable in any context.
+    """
+    doc_id = _doc(reply)
+    doc = docs[doc_id]
+    if pack:
+        doc["packs"].add(intent)
+    elif intent:
+        doc["intents"].add(intent)
+    if context:
+        doc["contexts"].add(context)
+    if cue and len(doc["cues"]) < MAX_CUES and cue not in doc["cues"]:
+        doc["cues"].append(cue)
+        _reindex(doc_id, _grams(cue))
+
+def build(sessions):
+    """
+    Index phrasepacks, learned weights, every reply chosen in history (from
+    the common-reply totals) and the cues of choices in `sessions`, an
+    iterable of session dicts.
+    """
+    docs.clear()
+    _by_text.clear()
+    _postings.clear()
+
+    for intent, pack in PHRASEPACKS.items():
+        for reply in pack:
+            add(None, intent, reply, pack=True)
+
+    # Learned weights are most of the rows at startup; skip add()'s per-call checks
+    for context, intent, texts in store.learned():
+        for reply in texts:
+            doc = docs[_doc(reply)]
+            doc["contexts"].add(context)
+            doc["intents"].add(intent)
+
+    for context, ranked in reply_index.index.items():
+        for reply in ranked.items:
+            docs[_doc(reply)]["contexts"].add(context)
+
+    for data in sessions:
+        for ex in data.get("exchanges", []):
+            if ex.get("chosen_reply"):
+                cue = ex.get("transcript") or ""
+                add(data.get("context"), classify_intent(cue), ex["chosen_reply"], cue)
+
+def suggest(transcript: str, context: str, intent: str, k: int = 9) -> list[str]:
+    """Return the k best local replies for a transcript."""
+    query = _grams(transcript) if transcript else set()
+
+    # Sparse dot product over the inverted index
+    sims = defaultdict(float)
+    max_df = max(1, len(docs) * COMMON_GRAM_RATIO)
+    for g in query:
+        posting = _postings.get(g)
+        if not posting or len(posting) > max_df:
+            continue
+        idf = _idf(g)
+        for doc_id in posting:
+            sims[doc_id] += idf
+
+    qnorm = math.sqrt(len(query)) or 1.0
+    candidates = sorted(sims, key=lambda d: sims[d] / docs[d]["norm"], reverse=True)[:CANDIDATES]
+
+    # Always keep the phrasepack for this intent in play
+    pack = PHRASEPACKS.get(intent) or PHRASEPACKS["generic"]
+    candidates = set(candidates) | {_by_text[r] for r in pack if r in _by_text}
+
+    # Only replies that fit this context: phrasepacks, or chosen here before
+    candidates = [d for d in candidates if docs[d]["packs"] or context in docs[d]["contexts"]]
+    texts = [docs[d]["text"] for d in candidates]
+    weights = store.get_weights(context, intent, texts)
+
+    scored = []
+    for d, w in zip(candidates, weights):
+        doc = docs[d]
+        score = sims.get(d, 0.0) / (doc["norm"] * qnorm)  # IDF-weighted overlap over binary norms
+        if intent in doc["packs"] or intent in doc["intents"]:
+            score += INTENT_BONUS
+        if context in doc["contexts"]:
+            score += CONTEXT_BONUS
+        score += WEIGHT_BONUS * math.log1p(max(w, 0))
+        scored.append((score, doc["text"]))
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    replies = [text for _, text in scored[:k]]
+
+    # Top up from the generic pack if the index is thin
+    for r in PHRASEPACKS["generic"]:
+        if len(replies) >= k:
+            break
+        if r not in replies:
+            replies.append(r)
+    return replies
@@ -1,69 +1,89 @@
-from fastapi import APIRouter
-from .models import SuggestReq, SuggestRes, SuggestItem, LogChoiceReq, ClearHistoryReq
+import asyncio
+import functools
+import json
+import logging
+import sqlite3
+import time
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from .models import SuggestReq, SuggestRes, SuggestItem, LogChoiceReq, ClearHistoryReq, LiveUpdate
 from .intents import classify_intent
-from .phrasepacks import PHRASEPACKS
-from .claude import generate_replies
+from .claude import generate_replies, stream_replies, usage as llm_usage
 from . import store
 from . import history
+from . import cache
+from . import retrieval
+from . import resilience
+from . import prefetch
+from . import live
+from . import logs
+from . import metrics
 
-router = APIRouter()
+log = logging.getLogger(__name__)
 
-def _fallback(intent: str) -> list[str]:
-    pack = PHRASEPACKS.get(intent) or PHRASEPACKS["generic"]
-    return pack[:9]
+router = APIRouter()
 
-@router.post("/suggest", response_model=SuggestRes)
-def suggest(req: SuggestReq):
-    text = (req.last_text or "")[:300]  # truncate to keep latency stable
-    context = req.context or "generic"
-    intent = classify_intent(text)
-
-    # LOG: Print received transcript
-    print("=" * 60)
-    print("📥 RECEIVED REQUEST:")
-    print(f"  Session ID: {req.session_id}")
-    print(f"  Context: {context}")
-    print(f"  Transcript: {repr(text)}")
-    print(f"  Transcript length: {len(text)} characters")
-    print(f"  Classified intent: {intent}")
-    print("=" * 60)
-
-    # Get conversation history for this session
-    conversation_history = history.get_history_for_llm(req.session_id)
-    print(f"📜 Conversation history:\n{conversation_history}\n")
+def _fallback(text: str, context: str, intent: str, reason: str) -> list[str]:
+    # Local retrieval: phrasepacks plus every reply chosen before, in milliseconds
+    metrics.inc("ichack_fallbacks_total", reason=reason)
+    return retrieval.suggest(text, context, intent)
 
+def _history_step(session_id: str, context: str, transcript: str, record: bool):
+    """The history half of _prepare; runs on the history thread."""
+    # Only the speech this session hasn't heard yet goes to the LLM
+    with metrics.span("history_read"):
+        text = history.new_speech(session_id, transcript)[:300]  # truncate to keep latency stable
+        # Get conversation history for this session
+        conversation_history = history.get_history_for_llm(session_id)
     # Get commonly chosen replies for this context
-    common_replies = history.get_common_replies(context)
-    print(f"⭐ Common replies for {context}: {common_replies}")
+    with metrics.span("common_replies"):
+        common_replies = history.get_common_replies(context)
 
     # Store this exchange in history (without chosen reply yet)
-    if text:
-        history.add_exchange(req.session_id, context, text)
+    if transcript and record:
+        try:
+            with metrics.span("history_write"):
+                history.add_exchange(session_id, context, transcript)
+        except sqlite3.Error as e:
+            # e.g. another worker held the write lock too long; suggestions don't need the exchange stored
+            log.warning("❌ History write failed, exchange not recorded: %r", e)
 
-    # Prefer Claude always; fallback only if Claude fails
-    try:
-        print("🤖 Sending to Claude AI...")
-        replies = generate_replies(text, context, conversation_history, common_replies)
-        print(f"✅ Claude generated {len(replies)} replies")
-    except Exception as e:
-        print("❌ Claude failed, using fallback:", repr(e))
-        replies = _fallback(intent)
+    return text, conversation_history, common_replies
 
-    # Rank by emergent weights
-    scored = []
-    for r in replies:
-        w = store.get_weight(context, intent, r)
-        score = 1.0 + 0.3 * w
-        scored.append((score, r))
+async def _prepare(req: SuggestReq, record: bool = True):
+    """
+    Extract the new speech, classify it, read history for the prompt and
+    record the exchange (unless `record` is false, for interim transcripts).
+    """
+    logs.start_request()
+    transcript = req.last_text or ""
+    context = req.context or "generic"
+    text, conversation_history, common_replies = await history.run(
+        _history_step, req.session_id, context, transcript, record
+    )
+    with metrics.span("classify"):
+        intent = classify_intent(text)
 
-    scored.sort(reverse=True, key=lambda x: x[0])
+    if logs.verbose(log):
+        log.debug("📥 Request session=%s context=%s intent=%s transcript=%r", req.session_id, context, intent, text)
+        log.debug("📜 Conversation history:\n%s", conversation_history)
+        log.debug("⭐ Common replies for %s: %s", context, common_replies)
 
-    print("\n📤 SENDING RESPONSE:")
-    for i, (score, reply_text) in enumerate(scored[:9]):
-        print(f"  {i+1}. [{score:.2f}] {reply_text}")
-    print("=" * 60 + "\n")
+    return text, context, intent, conversation_history, common_replies
 
-    return SuggestRes(suggestions=[
+def _rank(context: str, intent: str, replies: list[str]) -> list[SuggestItem]:
+    """Rank replies by emergent weights."""
+    with metrics.span("rank"):
+        scored = [
+            (1.0 + 0.3 * w, r)
+            for w, r in zip(store.get_weights(context, intent, replies), replies)
+        ]
+
+        scored.sort(reverse=True, key=lambda x: x[0])
+
+    return [
         SuggestItem(
             id=f"{context}:{intent}:{i}",
             text=reply_text,
@@ -71,25 +91,322 @@ def suggest(req: SuggestReq):
             score=float(score),
         )
         for i, (score, reply_text) in enumerate(scored[:9])
-    ])
+    ]
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+# Handlers are async so they run on the event loop instead of queueing on the
+# threadpool. History calls go to the history thread (history.run), so waits on
+# SQLite don't block the loop; weights are read from store's locked cache.
+@router.post("/suggest", response_model=SuggestRes)
+async def suggest(req: SuggestReq):
+    text, context, intent, conversation_history, common_replies = await _prepare(req)
+
+    if req.mode == "fast":
+        replies = _fallback(text, context, intent, "fast")
+        return SuggestRes(suggestions=_rank(context, intent, replies))
+
+    # Prefer Claude; fall back if it fails, the breaker is open or the budget runs out.
+    # A call that misses the budget keeps running and fills the cache.
+    key = cache.make_key(context, intent, text, conversation_history)
+    budget = req.budget_ms / 1000 if req.budget_ms else resilience.LATENCY_BUDGET
+    deadline = time.monotonic() + budget
+    prefetched = prefetch.take(req.session_id, context, conversation_history, text, intent)
+    try:
+        replies = None
+        if prefetched is not None:
+            try:
+                replies = await asyncio.wait_for(asyncio.shield(prefetched), budget)
+            except asyncio.TimeoutError:
+                raise
+            except Exception as e:
+                # The breaker already counted it; ask again with what is left of the budget
+                log.warning("❌ Prefetch failed, asking again: %r", e)
+        if replies is None:
+            generation = cache.get_or_generate(key, lambda: resilience.call(
+                lambda: generate_replies(text, context, conversation_history, common_replies)
+            ))
+            replies = await asyncio.wait_for(generation, max(0.0, deadline - time.monotonic()))
+    except asyncio.TimeoutError:
+        log.warning("⏱️ Claude missed the %.1fs budget, using fallback", budget)
+        resilience.stats["timeouts"] += 1
+        replies = _fallback(text, context, intent, "timeout")
+    except resilience.CircuitOpen:
+        replies = _fallback(text, context, intent, "circuit_open")
+    except Exception as e:
+        log.warning("❌ Claude failed, using fallback: %r", e)
+        replies = _fallback(text, context, intent, "error")
+
+    suggestions = _rank(context, intent, replies)
+
+    if logs.verbose(log):
+        log.debug("📤 Response%s: %s", " (prefetched)" if prefetched is not None else "",
+                  [f"[{s.score:.2f}] {s.text}" for s in suggestions])
+
+    return SuggestRes(suggestions=suggestions)
+
+@router.post("/suggest/stream")
+async def suggest_stream(req: SuggestReq):
+    """
+    Server-Sent Events variant of /suggest.
+
+    Events, in order:
+        fallback: ranked local retrieval suggestions, sent immediately
+        reply:    {"index", "text", "intent"} for each Claude reply as it streams in
+        final:    the full ranked list (same shape as /suggest)
+    """
+    text, context, intent, conversation_history, common_replies = await _prepare(req)
+    fallback = retrieval.suggest(text, context, intent)
+
+    prefetched = prefetch.take(req.session_id, context, conversation_history, text, intent) if req.mode != "fast" else None
+
+    async def events():
+        yield _sse("fallback", SuggestRes(suggestions=_rank(context, intent, fallback)).model_dump_json())
+        if req.mode == "fast":
+            metrics.inc("ichack_fallbacks_total", reason="fast")
+            yield _sse("final", SuggestRes(suggestions=_rank(context, intent, fallback)).model_dump_json())
+            return
+
+        key = cache.make_key(context, intent, text, conversation_history)
+        reason = "stream_short"  # why the list needs topping up from fallback, if it does
+        cached = cache.get(key)
+        if cached is not None:
+            cache.stats["hits"] += 1
+        elif prefetched is not None:
+            try:
+                cached = list(await asyncio.shield(prefetched))
+            except Exception as e:
+                log.warning("❌ Prefetch failed: %r", e)
+        if cached is not None:
+            for i, r in enumerate(cached):
+                yield _sse("reply", json.dumps({"index": i, "text": r, "intent": intent}))
+            replies = cached
+        elif not resilience.allow():
+            resilience.stats["short_circuits"] += 1
+            replies = []
+            reason = "circuit_open"
+        else:
+            cache.stats["misses"] += 1
+            replies = []
+            t0 = time.monotonic()
+            try:
+                async for r in stream_replies(text, context, conversation_history, common_replies):
+                    yield _sse("reply", json.dumps({"index": len(replies), "text": r, "intent": intent}))
+                    replies.append(r)
+                resilience.record_success(time.monotonic() - t0)
+                if len(replies) == 9:
+                    cache.put(key, replies)
+            except Exception as e:
+                log.warning("❌ Claude stream failed, topping up with fallback: %r", e)
+                resilience.record_failure()
+                reason = "error"
+            finally:
+                # Client went away mid-stream: no outcome to record
+                resilience.release_probe()
+
+        # Fill any gap left by a short or failed stream from the local suggestions
+        if len(replies) < 9:
+            metrics.inc("ichack_fallbacks_total", reason=reason)
+        for r in fallback:
+            if len(replies) >= 9:
+                break
+            if r not in replies:
+                replies.append(r)
+
+        yield _sse("final", SuggestRes(suggestions=_rank(context, intent, replies)).model_dump_json())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+async def _live_update(ws: WebSocket, conn: tuple, req: SuggestReq, final: bool, seq: int, received: float):
+    """Compute one live update and push it: local suggestions at once, then the LLM's."""
+    text, context, intent, conversation_history, common_replies = await _prepare(req, record=final)
+
+    async def push(kind: str, replies: list[str]):
+        res = SuggestRes(suggestions=_rank(context, intent, replies))
+        await ws.send_json({"type": kind, "seq": seq, "final": final, **res.model_dump()})
+        metrics.observe("ichack_live_push_seconds", time.perf_counter() - received, kind=kind)
+
+    if req.mode == "fast":
+        live.release(conn)
+        await push("suggestions", _fallback(text, context, intent, "fast"))
+        return
+
+    key = cache.make_key(context, intent, text, conversation_history)
+    replies = cache.get(key)
+    if replies is not None:
+        cache.stats["hits"] += 1
+        live.release(conn)
+        await push("suggestions", replies)
+        return
+
+    await push("fallback", retrieval.suggest(text, context, intent))
+    # Only a final transcript may claim the prefetch; an interim one would use it up too early
+    prefetched = prefetch.take(req.session_id, context, conversation_history, text, intent) if final else None
+    try:
+        replies = None
+        if prefetched is not None:
+            live.release(conn)
+            try:
+                replies = list(await asyncio.shield(prefetched))
+            except Exception as e:
+                log.warning("❌ Prefetch failed, asking again: %r", e)
+        if replies is None:
+            replies = await live.replies(conn, key, lambda: resilience.call(
+                lambda: generate_replies(text, context, conversation_history, common_replies)
+            ))
+    except resilience.CircuitOpen:
+        replies = _fallback(text, context, intent, "circuit_open")
+    except Exception as e:
+        log.warning("❌ Claude failed, using fallback: %r", e)
+        replies = _fallback(text, context, intent, "error")
+
+    await push("suggestions", replies)
+
+@router.websocket("/suggest/live/{session_id}")
+async def suggest_live(ws: WebSocket, session_id: str, context: str = "generic"):
+    """
+    WebSocket variant of /suggest that follows live speech.
+
+    The client sends {"type": "interim" | "final", "text": cumulative transcript}
+    as recognition results come in. Interim transcripts are debounced and not
+    recorded; finals are recorded in history. Each message supersedes the
+    previous one, and an LLM call it no longer needs is cancelled.
+
+    Pushed per update, each with "seq" (higher is newer) and "final":
+        fallback:    local retrieval suggestions, sent at once on a cache miss
+        suggestions: the ranked list (same shape as /suggest)
+    """
+    await ws.accept()
+    conn = live.connect(session_id)
+    seq = 0
+    last = None
+    try:
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            try:
+                # Text or binary frames; bad JSON is a ValidationError too
+                msg = LiveUpdate.model_validate_json(message.get("text") or message.get("bytes") or "")
+            except ValidationError as e:
+                await ws.send_json({"type": "error", "detail": str(e)})
+                continue
+
+            final = msg.type == "final"
+            # Recognition re-sends unchanged interim results; only a final has to go through again
+            norm = cache.normalize(msg.text)
+            if norm == last and not final:
+                continue
+            last = norm
+
+            seq += 1
+            req = SuggestReq(session_id=session_id, last_text=msg.text, context=msg.context or context, mode=msg.mode)
+            live.schedule(conn, 0 if final else live.DEBOUNCE,
+                          functools.partial(_live_update, ws, conn, req, final, seq, time.perf_counter()))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live.close(conn)
+
+@router.get("/llm_stats")
+async def llm_stats():
+    return {**resilience.get_stats(), "usage": llm_usage}
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text format: stage timings, fallbacks, cache, LLM resilience, prefetch, live and token counters."""
+    cache_stats = cache.get_stats()
+    llm = resilience.get_stats()
+    external = [
+        ("ichack_cache_lookups_total", "counter", "Suggestion cache lookups by result",
+         {(("result", k),): cache_stats[k] for k in ("hits", "misses", "coalesced")}),
+        ("ichack_cache_cancelled_total", "counter", "Shared LLM calls cancelled once no caller needed them",
+         {(): cache_stats["cancelled"]}),
+        ("ichack_cache_entries", "gauge", "Entries in the suggestion cache", {(): cache_stats["size"]}),
+        ("ichack_llm_events_total", "counter", "LLM calls, failures, timeouts, hedges and short circuits",
+         {(("event", k),): v for k, v in resilience.stats.items()}),
+        ("ichack_llm_breaker_open", "gauge", "1 while the circuit breaker is open", {(): int(llm["breaker_open"])}),
+        ("ichack_llm_tokens_total", "counter", "Tokens reported by the API",
+         {(("type", k.removesuffix("_tokens")),): v for k, v in llm_usage.items() if k != "calls"}),
+        ("ichack_sessions_resident", "gauge", "Sessions held in memory", {(): len(history.history)}),
+        ("ichack_live_events_total", "counter", "Live WebSocket connections and updates, and updates replaced by newer speech",
+         {(("event", k),): v for k, v in live.stats.items()}),
+        ("ichack_prefetch_events_total", "counter", "Speculative next-turn generations",
+         {(("event", k),): v for k, v in prefetch.stats.items()}),
+    ]
+    return PlainTextResponse(metrics.render(external), media_type="text/plain; version=0.0.4")
+
+@router.get("/prefetch_stats")
+async def prefetch_stats():
+    return prefetch.get_stats()
+
+@router.get("/live_stats")
+async def live_stats():
+    return live.get_stats()
+
+@router.get("/cache_stats")
+async def cache_stats():
+    return cache.get_stats()
+
+def _choice_step(session_id: str, context: str, text: str):
+    """
+    The history half of /log_choice; runs on the history thread.
+
+    Returns (transcript the choice answered, history window, common replies)
+    for the next turn; the last two are None if no choice was recorded.
+    """
+    cue = history.get_last_transcript(session_id)
+    # Update conversation history with the chosen reply
+    try:
+        with metrics.span("history_write"):
+            recorded = history.update_last_exchange_with_choice(session_id, text)
+    except sqlite3.Error as e:
+        log.warning("❌ History write failed, choice not recorded: %r", e)
+        recorded = False
+    if not recorded:
+        return cue, None, None
+    return cue, history.get_history_for_llm(session_id), history.get_common_replies(context)
 
 @router.post("/log_choice")
-def log_choice(req: LogChoiceReq):
+async def log_choice(req: LogChoiceReq):
     # Store chosen reply so it rises to the top over time
-    print(f"📊 User chose: {repr(req.text)} (context: {req.context}, intent: {req.intent})")
+    logs.start_request()
+    if logs.verbose(log):
+        log.debug("📊 User chose: %r (context: %s, intent: %s)", req.text, req.context, req.intent)
     
-    # Update weight for scoring
+    # Update weight for scoring (saved in the background)
     store.bump(req.context, req.intent, req.text, delta=1)
-    store.save()
-    
-    # Update conversation history with the chosen reply
-    history.update_last_exchange_with_choice(req.session_id, req.text)
+
+    cue, conversation_history, common_replies = await history.run(
+        _choice_step, req.session_id, req.context, req.text
+    )
+
+    # Make the reply retrievable locally, cued by what was just heard
+    retrieval.add(req.context, req.intent, req.text, cue=cue)
+
+    # Start on the next turn's suggestions while the other person answers
+    # (not for a session with nothing to follow on from)
+    if conversation_history is not None and not resilience.is_open():
+        prefetch.start(
+            req.session_id, req.context, conversation_history,
+            # Through the breaker like any other call, so prefetch failures and latencies count
+            lambda: resilience.call(lambda: generate_replies("", req.context, conversation_history, common_replies)),
+        )
     
     return {"ok": True}
 
 @router.post("/clear_history")
-def clear_history(req: ClearHistoryReq):
+async def clear_history(req: ClearHistoryReq):
     # Clear conversation history for this session
-    print(f"🧹 Clearing history for session: {req.session_id}")
-    history.clear_session(req.session_id)
+    logs.start_request()
+    if logs.verbose(log):
+        log.debug("🧹 Clearing history for session: %s", req.session_id)
+    await history.run(history.clear_session, req.session_id)
+    prefetch.cancel(req.session_id)
+    live.close_session(req.session_id)
     return {"ok": True}
@@ -1,25 +1,256 @@
 import json
 import os
+import sqlite3
+import threading
+import time
 
-WEIGHTS_FILE = "backend/weights.json"
+from . import metrics
+from . import weight_index
+
+WEIGHTS_DB = os.getenv("WEIGHTS_DB", "backend/weights.db")
+WEIGHTS_FILE = os.getenv("WEIGHTS_FILE", "backend/weights.json")  # legacy, imported once
+FLUSH_INTERVAL = 2.0    # seconds between background flushes (and reads of other workers' bumps)
+FLUSH_AFTER = 100       # ...or flush as soon as this many bumps are pending
+HALF_LIFE_DAYS = 30     # a weight halves after this long without being bumped
+MIN_WEIGHT = 0.05       # decayed weights below this are dropped at startup...
+PRUNE_INTERVAL = 3600.0 # ...and by a save this many seconds after the last drop
+
+# Local read cache of the weights table, shared by every worker process:
+# context -> intent -> text -> [weight, last_bumped (unix time)]
+# weight_index finds a candidate's near-duplicates among a context/intent's texts.
 weights = {}
 
+# Storage: bumps are applied to the local cache at once and queued as deltas.
+# The flusher thread adds them in SQLite with an upsert that decays the stored
+# weight and adds the delta in one statement, so concurrent workers' bumps
+# commute and none are lost. Each flush bumps meta.version and stamps the rows
+# it touched; every worker then pulls rows newer than the last version it saw.
+
+_lock = threading.Lock()
+_save_lock = threading.Lock()  # the flusher and shutdown can save at once
+_deltas = []  # (context, intent, text, delta, ts) not yet in the database
+_seen = -1    # highest meta.version pulled into `weights`
+_wake = threading.Event()
+_flusher = None
+_pruned = 0.0  # time.monotonic() of the last drop of decayed weights
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS weights (
+    context TEXT NOT NULL,
+    intent TEXT NOT NULL,
+    text TEXT NOT NULL,
+    w REAL NOT NULL,
+    last_bumped REAL NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (context, intent, text)
+);
+CREATE INDEX IF NOT EXISTS weights_version ON weights (version);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+UPSERT = """
+INSERT INTO weights (context, intent, text, w, last_bumped, version) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (context, intent, text) DO UPDATE SET
+    w = decay(w, last_bumped, MAX(last_bumped, excluded.last_bumped))
+        + decay(excluded.w, excluded.last_bumped, MAX(last_bumped, excluded.last_bumped)),
+    last_bumped = MAX(last_bumped, excluded.last_bumped),
+    version = excluded.version
+"""
+
+def _decay(w: float, since: float, now: float) -> float:
+    return w * 0.5 ** ((now - since) / (HALF_LIFE_DAYS * 86400))
+
+def _decayed(entry, now: float) -> float:
+    w, t = entry
+    return _decay(w, t, now)
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(WEIGHTS_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(WEIGHTS_DB, isolation_level=None, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    conn.create_function("decay", 3, _decay, deterministic=True)
+    return conn
+
+def _import_legacy(conn: sqlite3.Connection):
+    """One-time import of weights.json (flat legacy or version 2) into the table."""
+    if not os.path.exists(WEIGHTS_FILE):
+        return
+    with open(WEIGHTS_FILE, "r") as f:
+        data = json.load(f)
+
+    if data.get("version") == 2:
+        nested = data["weights"]
+    else:
+        # Legacy flat {"context||intent||text": count} file
+        now = time.time()
+        nested = {}
+        for k, w in data.items():
+            context, intent, text = k.split("||", 2)
+            nested.setdefault(context, {}).setdefault(intent, {})[text] = [w, now]
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO weights (context, intent, text, w, last_bumped, version) VALUES (?, ?, ?, ?, ?, 0)",
+        [
+            (context, intent, text, w, t)
+            for context, intents in nested.items()
+            for intent, texts in intents.items()
+            for text, (w, t) in texts.items()
+        ],
+    )
+
 def load():
-    global weights
-    if os.path.exists(WEIGHTS_FILE):
-        with open(WEIGHTS_FILE, "r") as f:
-            weights = json.load(f)
+    global weights, _seen, _flusher, _pruned
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")  # workers starting together import once
+        if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM weights)").fetchone()[0]:
+            _import_legacy(conn)
+        conn.execute("DELETE FROM weights WHERE decay(w, last_bumped, ?) < ?", (time.time(), MIN_WEIGHT))
+        conn.execute("COMMIT")
+        _pruned = time.monotonic()
+
+        weights = {}
+        weight_index.reset()
+        _seen = -1
+        _pull(conn)
+    finally:
+        conn.close()
+
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_flush_loop, name="weights-flusher", daemon=True)
+        _flusher.start()
+
+def _pull(conn: sqlite3.Connection):
+    """Copy rows changed since the last pull (by any worker) into the local cache."""
+    global _seen
+    conn.execute("BEGIN")
+    try:
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        if version == _seen:
+            return
+        rows = conn.execute(
+            "SELECT context, intent, text, w, last_bumped FROM weights WHERE version > ?", (_seen,)
+        ).fetchall()
+    finally:
+        conn.execute("COMMIT")
+
+    with _lock:
+        # The first pull after load() fills an empty cache; the fuzzy index is built later, on lookup
+        indexed = _seen >= 0
+        for context, intent, text, w, t in rows:
+            texts = weights.setdefault(context, {}).setdefault(intent, {})
+            if indexed and text not in texts:
+                weight_index.add(context, intent, text)
+            texts[text] = [w, t]
+        # Bumps queued after this flush started aren't in the rows yet
+        if _deltas:
+            pulled = {(context, intent, text) for context, intent, text, _, _ in rows}
+            for context, intent, text, delta, t in _deltas:
+                if (context, intent, text) in pulled:
+                    _add(context, intent, text, delta, t)
+        _seen = version
 
-def save():
-    with open(WEIGHTS_FILE, "w") as f:
-        json.dump(weights, f, indent=2)
+def _add(context, intent, text, delta, now):
+    texts = weights.setdefault(context, {}).setdefault(intent, {})
+    entry = texts.get(text)
+    if entry is None:
+        weight_index.add(context, intent, text)
+    texts[text] = [(_decayed(entry, now) if entry else 0) + delta, now]
 
-def _key(context, intent, text):
-    return f"{context}||{intent}||{text}"
+def save(conn: sqlite3.Connection = None):
+    """Add every queued bump in the database (one transaction), then pull other workers' changes."""
+    global _deltas
+    own = conn is None
+    with _save_lock, metrics.span("persist_weights"):
+        if own:
+            conn = _connect()
+        try:
+            with _lock:
+                batch, _deltas = _deltas, []
+            if batch:
+                try:
+                    conn.execute("BEGIN IMMEDIATE")
+                    version = conn.execute(
+                        "UPDATE meta SET value = value + 1 WHERE key = 'version' RETURNING value"
+                    ).fetchone()[0]
+                    conn.executemany(UPSERT, [(c, i, t, d, ts, version) for c, i, t, d, ts in batch])
+                    conn.execute("COMMIT")
+                except Exception:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    with _lock:
+                        _deltas = batch + _deltas  # retry on the next flush
+                    raise
+            _pull(conn)
+            if time.monotonic() - _pruned >= PRUNE_INTERVAL:
+                _prune(conn)
+        finally:
+            if own:
+                conn.close()
+
+def _prune(conn: sqlite3.Connection):
+    """Drop weights that decayed below MIN_WEIGHT from the table and the local cache."""
+    global _pruned
+    now = time.time()
+    conn.execute("DELETE FROM weights WHERE decay(w, last_bumped, ?) < ?", (now, MIN_WEIGHT))
+    with _lock:
+        for context, intents in weights.items():
+            for intent, texts in intents.items():
+                stale = [text for text, entry in texts.items() if _decayed(entry, now) < MIN_WEIGHT]
+                for text in stale:
+                    del texts[text]
+                if stale:
+                    weight_index.drop(context, intent)
+    _pruned = time.monotonic()
+
+def _flush_loop():
+    conn = _connect()
+    while True:
+        _wake.wait(FLUSH_INTERVAL)
+        _wake.clear()
+        try:
+            save(conn)
+        except sqlite3.Error:
+            pass  # deltas were put back; try again next interval
 
 def get_weight(context, intent, text):
-    return weights.get(_key(context, intent, text), 0)
+    return get_weights(context, intent, [text])[0]
+
+def get_weights(context, intent, texts: list[str]) -> list[float]:
+    """
+    Weights for a batch of candidate texts under one context/intent, in order.
+
+    A candidate gets the weight of every stored reply with the same
+    canonical form, plus the weight of near-duplicates scaled by their
+    similarity (see weight_index).
+    """
+    bucket = weights.get(context, {}).get(intent)
+    if not bucket:
+        return [0] * len(texts)
+    now = time.time()
+    out = []
+    with _lock:  # the flusher thread adds texts to the index
+        forms = weight_index.get(context, intent, bucket)
+        for text in texts:
+            w = 0
+            for stored, sim in forms.matches(text):
+                w += sim * sum(_decayed(bucket[s], now) for s in stored)
+            out.append(w)
+    return out
+
+def learned() -> list[tuple[str, str, list[str]]]:
+    """(context, intent, texts) for every reply with a weight; a copy, as the flusher thread adds to the cache."""
+    with _lock:
+        return [(context, intent, list(texts)) for context, intents in weights.items() for intent, texts in intents.items()]
 
 def bump(context, intent, text, delta=1):
-    k = _key(context, intent, text)
-    weights[k] = weights.get(k, 0) + delta
+    now = time.time()
+    with _lock:
+        _add(context, intent, text, delta, now)
+        _deltas.append((context, intent, text, delta, now))
+        pending = len(_deltas)
+    if pending >= FLUSH_AFTER:
+        _wake.set()
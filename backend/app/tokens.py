@@ -0,0 +1,3 @@
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
@@ -0,0 +1,145 @@
+import math
+import re
+from collections import Counter
+
+# Fuzzy lookup of replies that have learned weights, so a candidate picks up
+# the weight of replies that say nearly the same thing. Claude rarely repeats
+# a reply word for word, and users type "Hello" and "hello" as separate
+# replies.
+#
+# Each reply is reduced to a canonical form (lowercase, no punctuation, single
+# spaces). Replies with the same form are pooled. Other forms match if the
+# IDF-weighted Jaccard similarity of their word sets is at least
+# MIN_SIMILARITY, so "the" counts for little and "burrito" for a lot.
+#
+# Candidates come from prefix filtering. Words are sorted rarest first, and
+# each form is indexed only under the shortest prefix whose remaining words
+# weigh less than MIN_SIMILARITY of the whole. Two forms that similar always
+# share a prefix word. The prefix is usually a few rare words, so a lookup
+# checks a handful of forms even with thousands stored.
+#
+# A context/intent's index is built on its first lookup, with word weights
+# from that bucket's replies, so startup doesn't pay for it. A word first
+# seen later counts as rarest. Weights stay fixed until the index is
+# rebuilt, so the index stays valid.
+
+MIN_SIMILARITY = 0.5   # weighted word-set Jaccard below this is a different reply
+MAX_MATCHES = 32       # near-duplicate forms counted per candidate; bounds the work for much-varied replies
+SIGNATURE_CACHE = 4096 # candidate signatures kept per index; candidates repeat from request to request
+
+index = {}  # (context, intent) -> _Forms
+
+def canonical(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s£']", " ", text.lower()).split())
+
+class _Forms:
+    """Canonical forms of one context/intent's weighted replies, indexed by their prefix words."""
+
+    def __init__(self, texts):
+        texts = list(texts)
+        df = Counter(w for text in texts for w in set(canonical(text).split()))
+        self.idf = {w: math.log((1 + len(texts)) / (1 + n)) + 1 for w, n in df.items()}
+        self.unseen_idf = math.log(1 + len(texts)) + 1  # weight of a word not seen at build time
+        self.known = set()   # stored reply texts already indexed
+        self.texts = {}      # canonical form -> stored reply texts with that form
+        self.words = {}      # canonical form -> word set
+        self.postings = {}   # word -> (form, its total weight, weight of its words after this one)
+        self.signatures = {} # candidate text -> signature
+        for text in texts:
+            self.add(text, self._sign(text))
+
+    def _sign(self, text: str) -> tuple:
+        """
+        (canonical form, distinct words rarest first, their weights, weight
+        left after each word, total weight, prefix length) of a reply.
+        """
+        form = canonical(text)
+        idf, unseen = self.idf, self.unseen_idf
+        ordered = tuple(sorted(set(form.split()), key=lambda w: (-idf.get(w, unseen), w)))
+        weights = tuple(idf.get(w, unseen) for w in ordered)
+        total = sum(weights)
+        rests = []
+        prefix = 0
+        for wt in weights:
+            rests.append((rests[-1] if rests else total) - wt)
+            if not prefix and rests[-1] < MIN_SIMILARITY * total - 1e-9:
+                prefix = len(rests)
+        return form, ordered, weights, tuple(rests), total, prefix
+
+    def signature(self, text: str) -> tuple:
+        sig = self.signatures.get(text)
+        if sig is None:
+            if len(self.signatures) >= SIGNATURE_CACHE:
+                self.signatures.clear()
+            sig = self.signatures[text] = self._sign(text)
+        return sig
+
+    def add(self, text: str, signature: tuple):
+        self.known.add(text)
+        form, ordered, _, rests, total, prefix = signature
+        texts = self.texts.get(form)
+        if texts is not None:
+            texts.append(text)
+            return
+        self.texts[form] = [text]
+        self.words[form] = frozenset(ordered)
+        for w, rest in zip(ordered[:prefix], rests):
+            self.postings.setdefault(w, []).append((form, total, rest))
+
+    def matches(self, text: str) -> list[tuple[list[str], float]]:
+        """
+        Stored replies that match `text`, grouped by canonical form.
+
+        Returns (stored texts, similarity) pairs; similarity is 1.0 for the same
+        canonical form, else the weighted Jaccard similarity of the word sets.
+        """
+        form, ordered, weights, rests, total, prefix = self.signature(text)
+
+        out = []
+        same = self.texts.get(form)
+        if same:
+            out.append((same, 1.0))
+        words = frozenset(ordered)
+        seen = {form}
+        idf, unseen = self.idf, self.unseen_idf
+        # Similarity t needs totals within a factor t of each other and an overlap
+        # of t/(1+t) of both totals
+        lo, hi = MIN_SIMILARITY * total, total / MIN_SIMILARITY
+        share = MIN_SIMILARITY / (1 + MIN_SIMILARITY)
+        for w, wt, rest in zip(ordered[:prefix], weights, rests):
+            for other, their_total, their_rest in self.postings.get(w, ()):
+                if other in seen:
+                    continue
+                seen.add(other)
+                if their_total < lo or their_total > hi:
+                    continue
+                # w is the first shared word, so only words after it in both orders add to the overlap
+                if wt + (rest if rest < their_rest else their_rest) < share * (total + their_total) - 1e-9:
+                    continue
+                common = sum(idf.get(x, unseen) for x in words & self.words[other])
+                sim = common / (total + their_total - common)
+                if sim >= MIN_SIMILARITY:
+                    out.append((self.texts[other], sim))
+                    if len(out) >= MAX_MATCHES:
+                        return out
+        return out
+
+def get(context: str, intent: str, texts) -> _Forms:
+    """The index for a context/intent, built from `texts` (its stored replies) on first use."""
+    forms = index.get((context, intent))
+    if forms is None:
+        forms = index[(context, intent)] = _Forms(texts)
+    return forms
+
+def add(context: str, intent: str, text: str):
+    """Index a newly stored reply; a context/intent not looked up yet picks it up when built."""
+    forms = index.get((context, intent))
+    if forms is not None and text not in forms.known:
+        forms.add(text, forms.signature(text))
+
+def drop(context: str, intent: str):
+    """Forget a context/intent's index after replies were removed; it is rebuilt on next lookup."""
+    index.pop((context, intent), None)
+
+def reset():
+    index.clear()
@@ -0,0 +1,123 @@
+"""
+Minimal stand-in for the Anthropic Messages API, for load tests.
+
+Run with:
+    FAKE_LATENCY_MS=500 python -m uvicorn backend.bench.fake_anthropic:app --port 8900
+
+Point the backend at it with ANTHROPIC_BASE_URL=http://127.0.0.1:8900.
+Streaming requests ("stream": true) spread the latency evenly over the
+replies, one text delta per line.
+
+Faults can be injected with env vars or at runtime via POST /config:
+    latency_ms   base latency per call
+    slow_rate    fraction of calls that take slow_ms instead
+    slow_ms
+    error_rate   fraction of calls answered with a 529 overloaded error
+"""
+import asyncio
+import json
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+config = {
+    "latency_ms": float(os.getenv("FAKE_LATENCY_MS", "500")),
+    "slow_rate": float(os.getenv("FAKE_SLOW_RATE", "0")),
+    "slow_ms": float(os.getenv("FAKE_SLOW_MS", "5000")),
+    "error_rate": float(os.getenv("FAKE_ERROR_RATE", "0")),
+}
+
+REPLIES = [
+    "Yes, that works for me.",
+    "Could you say that again, please?",
+    "I need a moment to think.",
+    "Thank you, that's helpful.",
+    "No, I don't think so.",
+    "Can you write it down for me?",
+    "How long will it take?",
+    "I'd like to pay by card.",
+    "Sorry, I didn't catch that.",
+]
+
+app = FastAPI(title="fake-anthropic")
+
+stats = {"requests": 0, "in_flight": 0, "peak_in_flight": 0, "errors": 0}
+
+def _latency() -> float:
+    if random.random() < config["slow_rate"]:
+        return config["slow_ms"] / 1000
+    return config["latency_ms"] / 1000
+
+def _message(body: dict, content: list, stop_reason) -> dict:
+    prompt = "".join(m["content"] for m in body.get("messages", []) if isinstance(m.get("content"), str))
+    return {
+        "id": f"msg_fake_{stats['requests']}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "fake"),
+        "content": content,
+        "stop_reason": stop_reason,
+        "stop_sequence": None,
+        "usage": {"input_tokens": len(prompt) // 4, "output_tokens": 90},
+    }
+
+def _event(data: dict) -> str:
+    return f"event: {data['type']}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream(body: dict, latency: float):
+    try:
+        yield _event({"type": "message_start", "message": _message(body, [], None)})
+        yield _event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        for reply in REPLIES:
+            await asyncio.sleep(latency / len(REPLIES))
+            yield _event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": reply + "\n"}})
+        yield _event({"type": "content_block_stop", "index": 0})
+        yield _event({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": 90}})
+        yield _event({"type": "message_stop"})
+    finally:
+        stats["in_flight"] -= 1
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+
+    latency = _latency()
+    if random.random() < config["error_rate"]:
+        try:
+            await asyncio.sleep(latency)
+        finally:
+            stats["in_flight"] -= 1
+        stats["errors"] += 1
+        return JSONResponse(
+            status_code=529,
+            content={"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded (injected)"}},
+        )
+
+    if body.get("stream"):
+        return StreamingResponse(_stream(body, latency), media_type="text/event-stream")
+
+    try:
+        await asyncio.sleep(latency)
+    finally:
+        stats["in_flight"] -= 1
+
+    return _message(body, [{"type": "text", "text": "\n".join(REPLIES)}], "end_turn")
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+@app.post("/reset")
+def reset():
+    stats.update(requests=0, in_flight=0, peak_in_flight=0, errors=0)
+    return stats
+
+@app.post("/config")
+async def set_config(request: Request):
+    config.update(await request.json())
+    return config
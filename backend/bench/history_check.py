@@ -0,0 +1,288 @@
+"""
+Randomized check of history's storage against a reference model.
+
+Two workers share one history database: this process and a child process,
+each with its own resident sessions and reply_index. A few thousand random
+operations go to either of them:
+
+    add, choose, clear, clear_all   the request paths (add_exchange, ...)
+    view                            a session as that worker sees it
+    compact                         fold the journal up to a random record, in
+                                    small batches, as the compactor does
+    reload                          restart the worker (history.load)
+
+Only a few sessions stay resident, so they are evicted and loaded back from
+snapshots plus journal records all the time; the other worker's writes,
+compactions and clear_alls reach each worker through sync(). A plain dict
+of sessions is the model. Checked along the way and at the end:
+
+  - every view, and every stored session once all is compacted, matches the model
+  - update_last_exchange_with_choice refuses sessions without exchanges
+  - both workers' reply_index and the replies table hold the model's totals,
+    in score order
+  - no worker keeps more than MAX_RESIDENT_SESSIONS sessions in memory
+
+    python -m backend.bench.history_check --ops 3000 --sessions 8 --resident 3
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+
+CONTEXTS = ["generic", "medical"]
+REPLIES = [f"reply {i}" for i in range(4)]
+COMPACT_BATCH = 5
+
+results = []
+
+def check(name: str, ok: bool, detail: str):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+
+def summary(data):
+    """The parts of a session the model keeps: context, (transcript, chosen reply) per exchange, heard."""
+    if data is None:
+        return None
+    return {
+        "context": data["context"],
+        "exchanges": [[ex["transcript"], ex["chosen_reply"]] for ex in data["exchanges"]],
+        "heard": data.get("heard"),
+    }
+
+def perform(op: str, args: list) -> dict:
+    """Run one operation on this process's history."""
+    from backend.app import history, reply_index
+    result = None
+    if op == "add":
+        history.add_exchange(*args)
+    elif op == "choose":
+        result = history.update_last_exchange_with_choice(*args)
+    elif op == "clear":
+        history.clear_session(*args)
+    elif op == "clear_all":
+        history.clear_all()
+    elif op == "view":
+        history.sync()
+        result = summary(history._session(*args))
+    elif op == "totals":
+        history.sync()
+        result = {
+            context: {
+                "items": [[reply, ranked.score[reply], ranked.refs[reply]] for reply in ranked.items],
+                "pos_ok": all(ranked.pos[reply] == k for k, reply in enumerate(ranked.items))
+                          and len(ranked.pos) == len(ranked.items),
+            }
+            for context, ranked in reply_index.index.items()
+        }
+    elif op == "reload":
+        history._conn.close()
+        history.load()
+    return {"result": result, "resident": len(history.history)}
+
+def serve():
+    """Child worker: operations in on stdin, results out on stdout, one JSON line each."""
+    from backend.app import history
+    history.COMPACT_EVERY = 10 ** 9  # the parent compacts
+    history.load()
+    for line in sys.stdin:
+        op, args = json.loads(line)
+        print(json.dumps(perform(op, args)), flush=True)
+
+class Child:
+    def __init__(self, env: dict):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-c", "from backend.bench.history_check import serve; serve()"],
+            env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+        )
+
+    def __call__(self, op: str, args: list) -> dict:
+        self.proc.stdin.write(json.dumps([op, args]) + "\n")
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("child worker exited")
+        return json.loads(line)
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+class Model:
+    def __init__(self):
+        from backend.app import history
+        self.history = history
+        self.sessions = {}
+
+    def add(self, session_id, context, transcript, chosen):
+        data = self.sessions.setdefault(session_id, {"context": context, "exchanges": [], "heard": None})
+        data["context"] = context
+        data["exchanges"] = (data["exchanges"] + [[transcript, chosen]])[-self.history.MAX_HISTORY_PER_SESSION:]
+        data["heard"] = self.history._fingerprint([self.history._norm(w) for w in transcript.split()])
+
+    def choose(self, session_id, reply) -> bool:
+        data = self.sessions.get(session_id)
+        if not (data and data["exchanges"]):
+            return False
+        data["exchanges"][-1][1] = reply
+        return True
+
+    def totals(self) -> Counter:
+        out = Counter()
+        for data in self.sessions.values():
+            for _, chosen in data["exchanges"]:
+                if chosen:
+                    out[(data["context"], chosen)] += 1
+        return out
+
+def totals_ok(dump: dict, want: Counter) -> tuple[bool, str]:
+    """Whether a worker's reply_index dump holds exactly `want`, sorted by score."""
+    got = {}
+    for context, ranked in dump.items():
+        scores = [score for _, score, _ in ranked["items"]]
+        if not ranked["pos_ok"] or scores != sorted(scores, reverse=True):
+            return False, f"{context} out of order: {ranked['items']}"
+        for reply, score, refs in ranked["items"]:
+            got[(context, reply)] = (score, refs)
+    expected = {key: (float(n), n) for key, n in want.items()}
+    if got != expected:
+        return False, f"got {got}, expected {expected}"
+    return True, ""
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ops", type=int, default=3000)
+    ap.add_argument("--sessions", type=int, default=8)
+    ap.add_argument("--resident", type=int, default=3, help="MAX_RESIDENT_SESSIONS for both workers")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ichack-history-")
+    env = {
+        **os.environ,
+        "HISTORY_DB": os.path.join(tmp, "conversation_history.db"),
+        "HISTORY_FILE": os.path.join(tmp, "conversation_history.json"),
+        "MAX_RESIDENT_SESSIONS": str(args.resident),
+    }
+    os.environ.update(env)
+    from backend.app import history
+    history.COMPACT_EVERY = 10 ** 9
+    history.COMPACT_BATCH = COMPACT_BATCH
+    history.load()
+    child = Child(env)
+    workers = [perform, child]
+    compactor = history._connect()
+
+    rng = random.Random(args.seed)
+    model = Model()
+    sessions = [f"s{i}" for i in range(args.sessions)]
+    counts = Counter()
+    failures = {}
+
+    def fail(kind: str, detail: str):
+        counts[f"{kind} failed"] += 1
+        failures.setdefault(kind, detail)
+
+    def verify_totals(step: int):
+        for w, worker in enumerate(workers):
+            ok, detail = totals_ok(worker("totals", [])["result"], model.totals())
+            counts["totals"] += 1
+            if not ok:
+                fail("totals", f"worker {w} after op {step}: {detail}")
+        rows = compactor.execute("SELECT context, reply, score, refs FROM replies WHERE refs > 0").fetchall()
+        got = {(context, reply): (score, refs) for context, reply, score, refs in rows}
+        counts["table"] += 1
+        if got != {key: (float(n), n) for key, n in model.totals().items()}:
+            fail("table", f"after op {step}: {got}")
+
+    try:
+        for step in range(args.ops):
+            w = rng.randrange(len(workers))
+            worker = workers[w]
+            sid = rng.choice(sessions)
+            r = rng.random()
+            if r < 0.45:
+                context = rng.choice(CONTEXTS)
+                transcript = f"heard {step} {rng.choice(['yes', 'no', 'maybe'])} {rng.randrange(100)}"
+                chosen = rng.choice(REPLIES) if rng.random() < 0.3 else None
+                out = worker("add", [sid, context, transcript, chosen])
+                model.add(sid, context, transcript, chosen)
+            elif r < 0.65:
+                reply = rng.choice(REPLIES)
+                out = worker("choose", [sid, reply])
+                want = model.choose(sid, reply)
+                counts["choose"] += 1
+                if out["result"] != want:
+                    fail("choose", f"op {step} worker {w} {sid}: returned {out['result']}, expected {want}")
+            elif r < 0.72:
+                out = worker("clear", [sid])
+                model.sessions.pop(sid, None)
+            elif r < 0.73:
+                out = worker("clear_all", [])
+                model.sessions.clear()
+                counts["clear_all"] += 1
+            elif r < 0.90:
+                out = worker("view", [sid])
+                counts["view"] += 1
+                if out["result"] != model.sessions.get(sid):
+                    fail("view", f"op {step} worker {w} {sid}: {out['result']} != {model.sessions.get(sid)}")
+            elif r < 0.97:
+                done = history._meta("compacted_through", compactor)
+                last = compactor.execute("SELECT COALESCE(MAX(id), 0) FROM journal").fetchone()[0]
+                if last > done:
+                    through = rng.randint(done + 1, last)
+                    while history._compact_batch(compactor, through):
+                        counts["batches"] += 1
+                    counts["batches"] += 1
+                    counts["compactions"] += 1
+                continue
+            else:
+                out = worker("reload", [])
+                counts["reloads"] += 1
+            counts["ops"] += 1
+            if out["resident"] > args.resident:
+                fail("resident", f"op {step} worker {w}: {out['resident']} sessions resident")
+            if step % 50 == 49:
+                verify_totals(step)
+
+        # Fold everything, then every session as each worker and a fresh load see it
+        last = compactor.execute("SELECT COALESCE(MAX(id), 0) FROM journal").fetchone()[0]
+        while history._compact_batch(compactor, last):
+            pass
+        verify_totals(args.ops)
+        for w, worker in enumerate(workers):
+            for sid in sessions:
+                counts["view"] += 1
+                got = worker("view", [sid])["result"]
+                if got != model.sessions.get(sid):
+                    fail("view", f"after compaction, worker {w} {sid}: {got} != {model.sessions.get(sid)}")
+        stored = {sid: summary(data) for sid, data in history.iter_sessions()}
+        stored_ok = stored == model.sessions
+    finally:
+        child.close()
+        compactor.close()
+        history._conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(f"{counts['ops']} ops on {args.sessions} sessions ({args.resident} resident per worker): "
+          f"{counts['compactions']} compactions in {counts['batches']} batches, "
+          f"{counts['clear_all']} clear_alls, {counts['reloads']} reloads")
+    for kind, name in (("view", "sessions match the model"),
+                       ("choose", "choices on sessions without exchanges are refused"),
+                       ("totals", "reply_index holds the model's totals"),
+                       ("table", "replies table holds the model's totals")):
+        bad = counts[f"{kind} failed"]
+        check(name, not bad, f"{counts[kind] - bad}/{counts[kind]} agree" + (f"; first: {failures[kind]}" if bad else ""))
+    check("stored sessions match the model after a full compaction", stored_ok,
+          f"{len(stored)} sessions" + ("" if stored_ok else f"; {stored} != {model.sessions}"))
+    check("resident sessions stay within the cap", not counts["resident failed"],
+          failures.get("resident", f"at most {args.resident} per worker"))
+    print(f"{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
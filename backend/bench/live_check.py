@@ -0,0 +1,126 @@
+"""
+Debounce and cancellation check for the live suggestions WebSocket.
+
+Starts the fake Anthropic server (800 ms per call) and the backend as
+subprocesses, then plays speech into /suggest/live the way the browser does:
+
+    burst       a sentence arriving word by word every 100 ms as interim
+                results, then the final after a pause. Debouncing should leave
+                one LLM call (for the last interim result), and the final
+                should reuse it.
+    supersede   an interim transcript that waits past the debounce (so its
+                call starts), then different speech. The first call should
+                be cancelled, and only the newest speech should get LLM
+                suggestions.
+
+For comparison it counts the calls a POST /suggest per interim result would make.
+
+    python -m backend.bench.live_check
+"""
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+import websockets
+
+from .fake_anthropic import REPLIES
+from .load_suggest import spawn, wait_ready
+
+FAKE_PORT = 8930
+PORT = 8931
+LATENCY_MS = 800
+
+results = []
+
+def check(name: str, ok: bool, detail: str):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+
+async def collect(ws, until_seq: int, timeout: float = 5.0) -> list[dict]:
+    """Read pushes until the "suggestions" for update `until_seq` arrives."""
+    pushes = []
+    deadline = time.monotonic() + timeout
+    while True:
+        msg = json.loads(await asyncio.wait_for(ws.recv(), deadline - time.monotonic()))
+        pushes.append(msg)
+        if msg["type"] == "suggestions" and msg["seq"] >= until_seq:
+            return pushes
+
+def from_llm(push: dict) -> bool:
+    return {s["text"] for s in push["suggestions"]} <= set(REPLIES)
+
+async def scenarios():
+    base = f"http://127.0.0.1:{PORT}"
+    async with httpx.AsyncClient(timeout=30) as http:
+        async def upstream_calls() -> int:
+            return (await http.get(f"http://127.0.0.1:{FAKE_PORT}/stats")).json()["requests"]
+
+        print("burst")
+        words = "could you tell me where the nearest pharmacy is".split()
+        before = await upstream_calls()
+        async with websockets.connect(f"ws://127.0.0.1:{PORT}/suggest/live/burst?context=shopping") as ws:
+            for i in range(1, len(words) + 1):
+                await ws.send(json.dumps({"type": "interim", "text": " ".join(words[:i])}))
+                await asyncio.sleep(0.1)
+            await asyncio.sleep(0.4)  # recognition finalizes after a pause; the last interim's call is running
+            await ws.send(json.dumps({"type": "final", "text": " ".join(words)}))
+            t0 = time.perf_counter()
+            pushes = await collect(ws, len(words) + 1)
+            wait = time.perf_counter() - t0
+        calls = await upstream_calls() - before
+        last = pushes[-1]
+        check("debounced to one LLM call", calls == 1,
+              f"{calls} upstream calls for {len(words)} interim results + final "
+              f"(a POST per interim result would make {len(words)})")
+        check("final served by the LLM", last["final"] and from_llm(last),
+              f"{len(pushes)} pushes, final suggestions {wait * 1000:.0f} ms after the final result")
+
+        print("supersede")
+        before = await upstream_calls()
+        async with websockets.connect(f"ws://127.0.0.1:{PORT}/suggest/live/supersede?context=medical") as ws:
+            await ws.send(json.dumps({"type": "interim", "text": "I have had a headache"}))
+            await asyncio.sleep(0.5)  # past the debounce: its call is running
+            await ws.send(json.dumps({"type": "interim", "text": "actually it is my back that hurts"}))
+            await asyncio.sleep(0.1)
+            await ws.send(json.dumps({"type": "final", "text": "actually it is my back that hurts"}))
+            pushes = await collect(ws, 3)
+        calls = await upstream_calls() - before
+        cache_stats = (await http.get(f"{base}/cache_stats")).json()
+        live_stats = (await http.get(f"{base}/live_stats")).json()
+        stale = [p for p in pushes if p["type"] == "suggestions" and p["seq"] < 3]
+        check("superseded call cancelled", cache_stats["cancelled"] >= 1 and live_stats["superseded"] >= 1,
+              f"{cache_stats['cancelled']} calls cancelled, {live_stats['superseded']} updates superseded, "
+              f"{calls} upstream calls")
+        check("only the newest speech gets LLM suggestions", not stale and from_llm(pushes[-1]),
+              f"{len(stale)} suggestion pushes for superseded speech")
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="ichack-live-")
+    fake = spawn("backend.bench.fake_anthropic:app", FAKE_PORT, {"FAKE_LATENCY_MS": str(LATENCY_MS)})
+    backend = spawn("backend.app.main:app", PORT, {
+        "ANTHROPIC_API_KEY": "fake",
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{FAKE_PORT}",
+        "HISTORY_FILE": os.path.join(tmp, "conversation_history.json"),
+        "HISTORY_DB": os.path.join(tmp, "conversation_history.db"),
+        "WEIGHTS_FILE": os.path.join(tmp, "weights.json"),
+        "WEIGHTS_DB": os.path.join(tmp, "weights.db"),
+    })
+    try:
+        wait_ready(f"http://127.0.0.1:{FAKE_PORT}/stats")
+        wait_ready(f"http://127.0.0.1:{PORT}/health")
+        asyncio.run(scenarios())
+    finally:
+        backend.terminate()
+        fake.terminate()
+        backend.wait()
+        fake.wait()
+
+    print(f"{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Concurrency load test for /suggest against the fake Anthropic server.
+
+Starts the fake server and the backend as subprocesses (data files go to a
+temp dir), fires N concurrent /suggest calls and reports latency plus the
+peak number of LLM calls the fake server saw in flight at once. Every
+request asks about different text, so each one misses the suggestion
+cache and makes its own LLM call. A sync handler on Starlette's threadpool
+tops out at 40; the async path should reach the full concurrency.
+
+    python -m backend.bench.load_suggest --requests 300 --latency-ms 2000
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+THREADPOOL_LIMIT = 40  # anyio's default worker thread count
+
+def spawn(target: str, port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+    )
+
+def wait_ready(url: str, timeout: float = 15.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=0.5)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+async def fire(base: str, n: int, concurrency: int) -> tuple[list[float], float]:
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60) as http:
+        async def one(i: int) -> float:
+            async with sem:
+                t0 = time.perf_counter()
+                r = await http.post("/suggest", json={
+                    "session_id": f"load-{i}",
+                    # Distinct text per request: identical ones would share one cached LLM call
+                    "last_text": f"Where is the train station? ({i})",
+                    "context": "generic",
+                })
+                r.raise_for_status()
+                return time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        latencies = await asyncio.gather(*(one(i) for i in range(n)))
+        return latencies, time.perf_counter() - t0
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=300)
+    ap.add_argument("--concurrency", type=int, default=300)
+    ap.add_argument("--latency-ms", type=float, default=2000)
+    ap.add_argument("--fake-port", type=int, default=8900)
+    ap.add_argument("--port", type=int, default=8901)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ichack-load-")
+    fake = spawn("backend.bench.fake_anthropic:app", args.fake_port, {"FAKE_LATENCY_MS": str(args.latency_ms)})
+    backend = spawn("backend.app.main:app", args.port, {
+        "ANTHROPIC_API_KEY": "fake",
+        "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{args.fake_port}",
+        "HISTORY_FILE": os.path.join(tmp, "conversation_history.json"),
+        "HISTORY_DB": os.path.join(tmp, "conversation_history.db"),
+        "WEIGHTS_FILE": os.path.join(tmp, "weights.json"),
+        "WEIGHTS_DB": os.path.join(tmp, "weights.db"),
+    })
+    try:
+        wait_ready(f"http://127.0.0.1:{args.fake_port}/stats")
+        wait_ready(f"http://127.0.0.1:{args.port}/health")
+
+        latencies, wall = asyncio.run(fire(f"http://127.0.0.1:{args.port}", args.requests, args.concurrency))
+        stats = httpx.get(f"http://127.0.0.1:{args.fake_port}/stats").json()
+
+        print(f"requests:          {args.requests} (concurrency {args.concurrency})")
+        print(f"fake LLM latency:  {args.latency_ms:.0f} ms")
+        print(f"wall time:         {wall:.2f} s  ({args.requests / wall:.0f} req/s)")
+        print(f"p50 / p99:         {percentile(latencies, 0.5) * 1000:.0f} / {percentile(latencies, 0.99) * 1000:.0f} ms")
+        print(f"LLM calls served:  {stats['requests']}")
+        print(f"peak in flight:    {stats['peak_in_flight']} (threadpool limit {THREADPOOL_LIMIT})")
+    finally:
+        backend.terminate()
+        fake.terminate()
+        backend.wait()
+        fake.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Lost-update check for running the backend with several uvicorn workers.
+
+Starts `uvicorn --workers N` on temp data files, then runs many sessions
+at once. Each session does turns of /suggest (fast mode, no LLM) followed
+by /log_choice. Every request opens a new connection, so consecutive
+requests of one session land on different workers. After a graceful
+shutdown it reads the databases back and checks that:
+
+  - every session has every exchange, in order, with the choice attached
+    to the exchange it was made for (per-session ordering across workers)
+  - every reply's weight equals the number of times it was chosen (no
+    bump lost to a concurrent worker)
+
+    python -m backend.bench.multiworker_check --workers 4 --sessions 40 --turns 15
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+from .load_suggest import wait_ready
+
+PORT = 8940
+REPLIES = 5  # distinct replies every session picks from, so bumps collide across workers
+
+results = []
+
+def check(name: str, ok: bool, detail: str):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+
+async def workload(base: str, sessions: int, turns: int) -> tuple[Counter, float]:
+    chosen = Counter()
+    # No keep-alive: each request gets a new connection and the kernel picks the worker
+    limits = httpx.Limits(max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=30) as http:
+        async def session(s: int):
+            for turn in range(turns):
+                r = await http.post("/suggest", json={
+                    "session_id": f"mw-{s}",
+                    "last_text": f"question {turn} from session {s}",
+                    "context": "generic",
+                    "mode": "fast",
+                })
+                r.raise_for_status()
+                text = f"reply {turn % REPLIES}"
+                r = await http.post("/log_choice", json={
+                    "session_id": f"mw-{s}",
+                    "suggestion_id": r.json()["suggestions"][0]["id"],
+                    "context": "generic",
+                    "intent": "generic",
+                    "text": text,
+                })
+                r.raise_for_status()
+                chosen[text] += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(session(s) for s in range(sessions)))
+        return chosen, time.perf_counter() - t0
+
+def verify_history(env: dict, sessions: int, turns: int):
+    # Replay the journal with the app's own loader, in a clean process
+    code = (
+        "import json; from backend.app import history; history.load(); "
+        "print(json.dumps(dict(history.iter_sessions())))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    data = json.loads(out.stdout)
+
+    bad = []
+    for s in range(sessions):
+        exchanges = data.get(f"mw-{s}", {}).get("exchanges", [])
+        expected = [(f"question {t} from session {s}", f"reply {t % REPLIES}") for t in range(turns)]
+        got = [(e["transcript"], e["chosen_reply"]) for e in exchanges]
+        if got != expected[-len(got):] or len(got) != min(turns, 20):
+            bad.append(f"mw-{s}")
+    check("history complete and in order", not bad,
+          f"{sessions - len(bad)}/{sessions} sessions intact" + (f", broken: {bad[:5]}" if bad else ""))
+
+def verify_weights(env: dict, chosen: Counter):
+    conn = sqlite3.connect(env["WEIGHTS_DB"])
+    stored = {text: w for text, w in conn.execute(
+        "SELECT text, w FROM weights WHERE context = 'generic' AND intent = 'generic'"
+    )}
+    conn.close()
+    # Half-life decay over a few seconds is ~1e-6 of a weight; anything bigger is a lost bump
+    lost = {t: round(n - stored.get(t, 0), 3) for t, n in chosen.items() if abs(n - stored.get(t, 0)) > 0.01}
+    check("no lost weight bumps", not lost,
+          f"{sum(chosen.values())} bumps over {len(chosen)} replies" + (f", off by {lost}" if lost else ""))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--sessions", type=int, default=40)
+    ap.add_argument("--turns", type=int, default=15)
+    ap.add_argument("--port", type=int, default=PORT)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ichack-multiworker-")
+    env = {
+        **os.environ,
+        "ANTHROPIC_API_KEY": "",
+        "HISTORY_FILE": os.path.join(tmp, "conversation_history.json"),
+        "HISTORY_DB": os.path.join(tmp, "conversation_history.db"),
+        "WEIGHTS_FILE": os.path.join(tmp, "weights.json"),
+        "WEIGHTS_DB": os.path.join(tmp, "weights.db"),
+    }
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app.main:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(f"http://127.0.0.1:{args.port}/health", timeout=60)
+        time.sleep(1)  # let every worker finish starting
+        chosen, wall = asyncio.run(workload(f"http://127.0.0.1:{args.port}", args.sessions, args.turns))
+        print(f"{args.workers} workers, {args.sessions} sessions x {args.turns} turns in {wall:.1f} s")
+    finally:
+        # SIGINT/SIGTERM: uvicorn shuts every worker down gracefully, which flushes the weights
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    verify_history(env, args.sessions, args.turns)
+    verify_weights(env, chosen)
+    print(f"{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
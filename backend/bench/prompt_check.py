@@ -0,0 +1,105 @@
+"""
+Recorded-fixture check for the prompt builder and token accounting.
+
+Runs generate_replies and stream_replies against a mocked transport that
+replays recorded Messages API responses, and checks that:
+
+  - the request body matches the recorded one (fixtures/prompt_request.json)
+  - the system prefix is identical for different inputs, so it can be cached
+  - a huge history is trimmed to PROMPT_TOKEN_BUDGET, newest lines kept
+  - reported input/output/cache tokens are added to claude.usage
+
+    python -m backend.bench.prompt_check            # check
+    python -m backend.bench.prompt_check --record   # re-record the request fixture
+"""
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+from anthropic import AsyncAnthropic
+
+from backend.app import claude
+from backend.app.tokens import estimate_tokens
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+HISTORY = "\n".join([
+    "[Heard]: Hi, what can I get for you today?",
+    "[User replied]: A burrito bowl, please.",
+    "[Heard]: Chicken or steak?",
+    "[User replied]: Chicken, please.",
+])
+COMMON = ["Thank you.", "Could you repeat that, please?", "Yes, please.", "No, thank you.", "Card, please.", "Extra."]
+
+results = []
+
+def check(name: str, ok: bool, detail: str = ""):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}{': ' + detail if detail else ''}")
+
+def fixture(name: str, mode: str = "r"):
+    return open(os.path.join(FIXTURES, name), mode)
+
+async def main(record: bool):
+    sent = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        sent.append(body)
+        if body.get("stream"):
+            return httpx.Response(200, content=fixture("prompt_stream.sse").read().encode(),
+                                  headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json=json.load(fixture("prompt_response.json")))
+
+    claude.client = AsyncAnthropic(
+        api_key="fixture",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    replies = await claude.generate_replies("Would you like anything to drink?", "restaurant", HISTORY, COMMON)
+    if record:
+        json.dump(sent[0], fixture("prompt_request.json", "w"), indent=2)
+        print("recorded fixtures/prompt_request.json")
+        return
+
+    check("request matches recording", sent[0] == json.load(fixture("prompt_request.json")))
+    check("9 cleaned replies", len(replies) == 9, replies[0])
+
+    system = sent[0]["system"]
+    other = claude.build_request("", "medical", "", None)
+    check("static system prefix is shared and cacheable",
+          other["system"] == system and system[0].get("cache_control") == {"type": "ephemeral"})
+    check("per-request data stays out of the system prefix",
+          "restaurant" not in system[0]["text"] and "burrito" not in system[0]["text"])
+
+    long_history = "\n".join(f"[Heard]: line {i} " + "word " * 20 for i in range(500))
+    req = claude.build_request("Anything else?", "restaurant", long_history, COMMON)
+    content = req["messages"][0]["content"]
+    total = estimate_tokens(claude.SYSTEM_PROMPT) + estimate_tokens(content)
+    check("huge history trimmed to budget", total <= claude.PROMPT_TOKEN_BUDGET,
+          f"{total} <= {claude.PROMPT_TOKEN_BUDGET} estimated tokens")
+    check("newest history kept, common replies dropped first",
+          "line 499" in content and "line 0 " not in content and "Card, please." not in content)
+
+    recorded = json.load(fixture("prompt_response.json"))["usage"]
+    check("usage recorded for create()",
+          claude.usage["input_tokens"] == recorded["input_tokens"]
+          and claude.usage["output_tokens"] == recorded["output_tokens"]
+          and claude.usage["cache_read_input_tokens"] == recorded["cache_read_input_tokens"],
+          json.dumps(claude.usage))
+
+    before = dict(claude.usage)
+    streamed = [r async for r in claude.stream_replies("Would you like anything to drink?", "restaurant", HISTORY, COMMON)]
+    check("stream yields 9 replies", len(streamed) == 9)
+    check("usage recorded for stream()",
+          claude.usage["calls"] == before["calls"] + 1 and claude.usage["output_tokens"] > before["output_tokens"],
+          f"+{claude.usage['input_tokens'] - before['input_tokens']} in, "
+          f"+{claude.usage['output_tokens'] - before['output_tokens']} out")
+
+    print(f"{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main("--record" in sys.argv))
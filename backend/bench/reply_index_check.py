@@ -0,0 +1,106 @@
+"""
+Randomized check of reply_index's ranking against a plain dict.
+
+Drives one _Ranked through random choices and un-choices of a handful of
+replies, with mostly whole-number weights so scores tie all the time, and
+after every change compares it with a dict of reply -> (score, refs):
+
+  - items hold exactly the replies with refs > 0, sorted by score
+  - pos maps every reply to its index
+  - score and refs match the dict
+
+set_score (another worker's totals) and load (a full reload) are mixed in.
+
+    python -m backend.bench.reply_index_check --ops 20000 --replies 6
+"""
+import argparse
+import random
+import sys
+from collections import Counter
+
+from backend.app import reply_index
+
+results = []
+
+def check(name: str, ok: bool, detail: str):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+
+def problem(ranked: reply_index._Ranked, model: dict):
+    """What's wrong with `ranked` compared with the model, or None."""
+    if any(ranked.pos.get(reply) != k for k, reply in enumerate(ranked.items)) or len(ranked.pos) != len(ranked.items):
+        return f"pos {ranked.pos} doesn't match items {ranked.items}"
+    got = {reply: (ranked.score.get(reply), ranked.refs.get(reply)) for reply in ranked.items}
+    if got != model:
+        return f"got {got}, expected {model}"
+    scores = [ranked.score[reply] for reply in ranked.items]
+    if scores != sorted(scores, reverse=True):
+        return f"out of order: {list(zip(ranked.items, scores))}"
+    return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--ops", type=int, default=20000)
+    ap.add_argument("--replies", type=int, default=6)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    replies = [f"reply {i}" for i in range(args.replies)]
+    reply_index.reset()
+    model = {}
+    counts = Counter()
+    failures = []
+
+    for step in range(args.ops):
+        counts["ops"] += 1
+        reply = rng.choice(replies)
+        score, refs = model.get(reply, (0.0, 0))
+        tied = reply in model and sum(s == score for s, _ in model.values()) > 1
+        r = rng.random()
+        if r < 0.02:
+            # A full reload from the totals
+            reply_index.load([("generic", k, s, n) for k, (s, n) in model.items()], None)
+            counts["loads"] += 1
+        elif r < 0.12:
+            # Another worker's totals for this reply
+            n = rng.randrange(4)
+            s = float(n * rng.choice([1, 1, 2]))
+            reply_index.set_score("generic", reply, s, n)
+            if n > 0:
+                model[reply] = (s, n)
+            else:
+                model.pop(reply, None)
+            counts["set_score"] += 1
+        else:
+            weight = rng.choice([1.0, 1.0, 1.0, 0.5, 2.0])
+            if refs > 0 and rng.random() < 0.45:
+                delta, n = -weight, -1
+            else:
+                delta, n = weight, 1
+            try:
+                reply_index.index.setdefault("generic", reply_index._Ranked()).add(reply, delta, n)
+            except Exception as e:
+                failures.append(f"op {step}: add({reply!r}, {delta}, {n}) raised {e!r}")
+                break
+            if refs + n > 0:
+                model[reply] = (score + delta, refs + n)
+            else:
+                model.pop(reply)
+                counts["removals"] += 1
+            counts["changes"] += 1
+            counts["tied"] += tied
+        wrong = problem(reply_index.index.setdefault("generic", reply_index._Ranked()), model)
+        if wrong:
+            failures.append(f"op {step}: {wrong}")
+
+    print(f"{args.ops} ops on {args.replies} replies: {counts['changes']} changes "
+          f"({counts['tied']} from a tied score, {counts['removals']} removals), "
+          f"{counts['set_score']} set_scores, {counts['loads']} loads")
+    check("ranking matches the dict after every change", not failures,
+          f"{counts['ops'] - len(failures)}/{counts['ops']} agree" + (f"; first: {failures[0]}" if failures else ""))
+    print(f"{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
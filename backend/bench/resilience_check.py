@@ -0,0 +1,135 @@
+"""
+Latency budget, hedging and circuit breaker against the fake Anthropic server.
+
+Starts the fake server and the backend (with a short breaker cool-down) as
+subprocesses, then walks through four scenarios by reconfiguring the fake
+server at runtime:
+
+    healthy   every call answers in ~200 ms
+    slow tail 10% of calls take 2 s; hedging should rescue most of them
+    outage    every call fails; the breaker opens, stops calling out, then
+              recovers with a probe once the fake server is healthy again
+    hang      every call takes 10 s; a 500 ms budget returns local suggestions
+
+    python -m backend.bench.resilience_check
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .fake_anthropic import REPLIES
+from .load_suggest import percentile, spawn, wait_ready
+from backend.app.resilience import BREAKER_FAILURES
+
+FAKE_PORT = 8910
+PORT = 8911
+COOLDOWN = 2.0
+
+BACKEND = f"""
+import uvicorn
+from backend.app import resilience
+resilience.BREAKER_COOLDOWN = {COOLDOWN}
+uvicorn.run("backend.app.main:app", port={PORT}, log_level="warning")
+"""
+
+results = []
+
+def check(name: str, ok: bool, detail: str):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+
+async def run(http: httpx.AsyncClient, n: int, concurrency: int, tag: str, budget_ms: int = None):
+    """Fire n unique /suggest calls; returns (latencies, how many came from the LLM)."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            t0 = time.perf_counter()
+            body = {"session_id": f"{tag}-{i}", "last_text": f"{tag} request number {i}", "context": "generic"}
+            if budget_ms:
+                body["budget_ms"] = budget_ms
+            r = await http.post(f"http://127.0.0.1:{PORT}/suggest", json=body)
+            texts = {s["text"] for s in r.json()["suggestions"]}
+            return time.perf_counter() - t0, texts <= set(REPLIES)
+
+    out = await asyncio.gather(*(one(i) for i in range(n)))
+    return [lat for lat, _ in out], sum(llm for _, llm in out)
+
+async def scenarios():
+    async with httpx.AsyncClient(timeout=30) as http:
+        fake = f"http://127.0.0.1:{FAKE_PORT}"
+
+        async def configure(**cfg):
+            await http.post(f"{fake}/config", json=cfg)
+
+        print("healthy")
+        await configure(latency_ms=200, slow_rate=0, error_rate=0)
+        lat, llm = await run(http, 30, 1, "healthy")
+        check("served by LLM", llm == 30, f"{llm}/30 from LLM, p50 {percentile(lat, 0.5) * 1000:.0f} ms")
+
+        print("slow tail")
+        await configure(latency_ms=200, slow_rate=0.1, slow_ms=2000)
+        lat, llm = await run(http, 100, 4, "tail")
+        stats = (await http.get(f"http://127.0.0.1:{PORT}/llm_stats")).json()
+        slow = sum(x > 1.5 for x in lat)
+        check("hedging trims the tail", slow <= 3 and stats["hedges"] > 0,
+              f"{slow}/100 requests hit the 2 s tail (~10 without hedging), p95 {percentile(lat, 0.95) * 1000:.0f} ms, "
+              f"{stats['hedges']} hedges, {stats['hedge_wins']} won")
+
+        print("outage")
+        await configure(latency_ms=50, error_rate=1.0)
+        await http.post(f"{fake}/reset")
+        lat, llm = await run(http, 30, 1, "outage")
+        calls = (await http.get(f"{fake}/stats")).json()["requests"]
+        stats = (await http.get(f"http://127.0.0.1:{PORT}/llm_stats")).json()
+        check("breaker opens and stops calling out", stats["breaker_open"] and stats["short_circuits"] >= 30 - BREAKER_FAILURES,
+              f"{stats['short_circuits']}/30 requests short-circuited, {calls} upstream calls incl. retries/hedges, "
+              f"p50 {percentile(lat, 0.5) * 1000:.0f} ms")
+
+        await configure(latency_ms=200, error_rate=0)
+        await asyncio.sleep(COOLDOWN + 0.2)
+        lat, llm = await run(http, 5, 1, "recovered")
+        check("probe closes the breaker", llm == 5, f"{llm}/5 from LLM after cool-down")
+
+        print("hang")
+        await configure(latency_ms=10000, slow_rate=0)
+        lat, llm = await run(http, 10, 10, "hang", budget_ms=500)
+        check("budget returns local suggestions", max(lat) < 1.5 and llm == 0,
+              f"max {max(lat) * 1000:.0f} ms, {llm}/10 from LLM")
+
+def main():
+    tmp = tempfile.mkdtemp(prefix="ichack-resilience-")
+    fake = spawn("backend.bench.fake_anthropic:app", FAKE_PORT, {})
+    backend = subprocess.Popen(
+        [sys.executable, "-c", BACKEND],
+        env={
+            **os.environ,
+            "ANTHROPIC_API_KEY": "fake",
+            "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{FAKE_PORT}",
+            "HISTORY_FILE": os.path.join(tmp, "conversation_history.json"),
+            "HISTORY_DB": os.path.join(tmp, "conversation_history.db"),
+            "WEIGHTS_FILE": os.path.join(tmp, "weights.json"),
+            "WEIGHTS_DB": os.path.join(tmp, "weights.db"),
+        },
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(f"http://127.0.0.1:{FAKE_PORT}/stats")
+        wait_ready(f"http://127.0.0.1:{PORT}/health")
+        asyncio.run(scenarios())
+    finally:
+        backend.terminate()
+        fake.terminate()
+        backend.wait()
+        fake.wait()
+
+    print(f"{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Startup benchmark: how long the backend takes from process start to
+answering /health, as the stored data grows.
+
+For each data size (sessions), writes the legacy JSON files
+(conversation_history.json and weights.json, as the app used to keep them)
+with the suite's synthetic data, then measures:
+
+    first start     uvicorn on the JSON files; the app imports them into
+                    SQLite before it is ready
+    convert         python -m backend.app.convert on a copy of the JSON files
+    after convert   the first uvicorn start on the converted databases
+    restart         median of later starts (what every --reload pays)
+    phases          where a restart's time goes, in a fresh process:
+                    imports, store.load, history.load, retrieval.build
+
+Files are read from the OS page cache after the first run, so these are warm-disk times.
+
+    python -m backend.bench.startup                   # 1k, 10k, 100k sessions
+    python -m backend.bench.startup --sizes 1000 --restarts 5
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from .load_suggest import spawn
+from .suite import data_env, seed
+
+PORT = 8950
+
+PHASE_CHILD = """
+import json, time
+timings = {}
+t = time.perf_counter()
+import backend.app.routes
+from backend.app import history, retrieval, store
+timings["imports"] = time.perf_counter() - t
+t = time.perf_counter()
+store.load()
+timings["store.load"] = time.perf_counter() - t
+t = time.perf_counter()
+history.load()
+timings["history.load"] = time.perf_counter() - t
+t = time.perf_counter()
+retrieval.build(data for _, data in history.iter_sessions(retrieval.BUILD_SESSIONS))
+timings["retrieval.build"] = time.perf_counter() - t
+print(json.dumps({k: v * 1000 for k, v in timings.items()}))
+"""
+
+def write_legacy(tmp: str, sessions: int):
+    """Seed tmp with the suite's data, then turn the seeded sessions into a legacy conversation_history.json."""
+    seed(tmp, sessions)
+    env = data_env(tmp)
+    conn = sqlite3.connect(env["HISTORY_DB"])
+    legacy = {sid: json.loads(data) for sid, data in conn.execute("SELECT session_id, data FROM sessions")}
+    conn.close()
+    with open(env["HISTORY_FILE"], "w") as f:
+        json.dump(legacy, f, indent=2)  # pretty-printed, as the app wrote it
+    os.remove(env["HISTORY_DB"])
+
+def time_to_ready(env: dict, timeout: float = 300.0) -> float:
+    """Seconds from spawning uvicorn until /health answers."""
+    t0 = time.perf_counter()
+    server = spawn("backend.app.main:app", PORT, {**env, "ANTHROPIC_API_KEY": ""})
+    try:
+        # Poll with bare connects: an HTTP client per attempt costs enough CPU to slow the server down
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", PORT), timeout=0.5).close()
+                break
+            except OSError:
+                if server.poll() is not None:
+                    raise RuntimeError("backend exited before it was ready")
+                if time.perf_counter() - t0 > timeout:
+                    raise RuntimeError("backend did not come up")
+                time.sleep(0.02)
+        httpx.get(f"http://127.0.0.1:{PORT}/health", timeout=30).raise_for_status()
+        return time.perf_counter() - t0
+    finally:
+        server.terminate()
+        server.wait()
+
+def bench_size(sessions: int, restarts: int) -> dict:
+    tmp = tempfile.mkdtemp(prefix=f"ichack-startup-{sessions}-")
+    try:
+        os.makedirs(os.path.join(tmp, "imported"))
+        write_legacy(os.path.join(tmp, "imported"), sessions)
+        shutil.copytree(os.path.join(tmp, "imported"), os.path.join(tmp, "converted"))
+        imported = data_env(os.path.join(tmp, "imported"))
+        converted = data_env(os.path.join(tmp, "converted"))
+        json_mb = sum(os.path.getsize(imported[k]) for k in ("HISTORY_FILE", "WEIGHTS_FILE")) / 1e6
+
+        first = time_to_ready(imported)
+
+        t = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "backend.app.convert"], env={**os.environ, **converted},
+                       check=True, stdout=subprocess.DEVNULL)
+        convert = time.perf_counter() - t
+        after_convert = time_to_ready(converted)
+
+        runs = sorted(time_to_ready(converted) for _ in range(restarts))
+        out = subprocess.run([sys.executable, "-c", PHASE_CHILD], env={**os.environ, **converted},
+                             check=True, capture_output=True, text=True)
+        return {
+            "json_mb": json_mb,
+            "first_start_s": first,
+            "convert_s": convert,
+            "after_convert_s": after_convert,
+            "restart_s": runs[len(runs) // 2],
+            "phases_ms": json.loads(out.stdout.strip().splitlines()[-1]),
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def report(sessions: int, result: dict):
+    print(f"\n== {sessions} sessions ({result['json_mb']:.1f} MB of JSON) ==")
+    print(f"  first start (imports JSON)   {result['first_start_s']:7.2f} s")
+    print(f"  convert                      {result['convert_s']:7.2f} s")
+    print(f"  first start after convert    {result['after_convert_s']:7.2f} s")
+    print(f"  restart (median)             {result['restart_s']:7.2f} s")
+    print("  restart phases: " + ", ".join(f"{k} {v:.0f} ms" for k, v in result["phases_ms"].items()))
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000", help="comma-separated session counts")
+    ap.add_argument("--restarts", type=int, default=3)
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    results = {}
+    for sessions in (int(s) for s in args.sizes.split(",")):
+        results[sessions] = bench_size(sessions, args.restarts)
+        report(sessions, results[sessions])
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Benchmark suite for the backend's hot paths.
+
+For each data size (sessions), seeds a temp history database and weights
+file with synthetic data, then:
+
+  1. times each stage of a /suggest + /log_choice turn in-process
+     (classification, history formatting, get_common_replies, LLM via the
+     fake server, ranking, persistence) plus startup load and a full flush
+  2. starts the backend against the same data and drives a mixed
+     /suggest, /log_choice, /clear_history workload over HTTP, reporting
+     p50/p99 latency and throughput per endpoint
+
+The LLM is the fake Anthropic server with configurable latency.
+
+    python -m backend.bench.suite                              # 10, 1k, 100k sessions
+    python -m backend.bench.suite --sizes 10,1000 --latency-ms 50
+    python -m backend.bench.suite --save baseline.json
+    python -m backend.bench.suite --compare baseline.json      # exit 1 on regression
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from .fake_anthropic import REPLIES
+from .load_suggest import percentile, spawn, wait_ready
+
+FAKE_PORT = 8920
+PORT = 8921
+REGRESSION_RATIO = 1.5  # --compare fails when a p99 grows past this multiple of the baseline...
+REGRESSION_FLOOR_MS = 1.0  # ...and by more than this, so sub-millisecond jitter doesn't count
+
+CONTEXTS = ["generic", "restaurant", "medical", "transport", "shop"]
+HEARD = [
+    "Hi, what can I get for you today?",
+    "Where does it hurt?",
+    "Which station are you going to?",
+    "That will be twelve pounds fifty please.",
+    "Can you say that again?",
+    "Do you have your booking reference?",
+    "Would you like a bag for that?",
+    "Is this your first visit?",
+    "Turn left at the lights and keep going.",
+    "Sorry, we are out of the chicken today.",
+]
+INTENTS = ["generic", "clarify", "directions", "payment", "food", "medical"]
+
+STAGES = ["classify", "history", "common_replies", "llm", "rank", "persist"]
+
+def data_env(tmp: str) -> dict:
+    """Environment pointing the app's data files into tmp."""
+    return {
+        "HISTORY_FILE": os.path.join(tmp, "conversation_history.json"),
+        "HISTORY_DB": os.path.join(tmp, "conversation_history.db"),
+        "WEIGHTS_FILE": os.path.join(tmp, "weights.json"),
+        "WEIGHTS_DB": os.path.join(tmp, "weights.db"),
+    }
+
+def seed(tmp: str, sessions: int, seed_value: int = 0):
+    """Write `sessions` synthetic sessions and a matching weights file into tmp."""
+    from backend.app.history import SCHEMA, MAX_HISTORY_PER_SESSION
+
+    rng = random.Random(seed_value)
+    # The reply vocabulary grows with the data, as it would with real users
+    vocabulary = REPLIES + [f"{rng.choice(REPLIES).rstrip('.?')} ({i})." for i in range(max(50, sessions // 10))]
+    start = datetime(2026, 1, 1)
+
+    env = data_env(tmp)
+    conn = sqlite3.connect(env["HISTORY_DB"])
+    conn.executescript(SCHEMA)
+    rows = []
+    weights = {}
+    now = time.time()
+    for s in range(sessions):
+        context = rng.choice(CONTEXTS)
+        ts = start + timedelta(minutes=s)
+        exchanges = []
+        for e in range(rng.randint(2, MAX_HISTORY_PER_SESSION)):
+            chosen = rng.choice(vocabulary)
+            exchanges.append({
+                "timestamp": (ts + timedelta(seconds=e * 20)).isoformat(),
+                "transcript": rng.choice(HEARD),
+                "chosen_reply": chosen,
+            })
+            entry = weights.setdefault(context, {}).setdefault(rng.choice(INTENTS), {}).setdefault(chosen, [0, now])
+            entry[0] += 1
+        rows.append((f"s{s}", json.dumps({
+            "context": context,
+            "exchanges": exchanges,
+            "created_at": exchanges[0]["timestamp"],
+            "updated_at": exchanges[-1]["timestamp"],
+        })))
+    with conn:
+        conn.executemany("INSERT INTO sessions (session_id, data) VALUES (?, ?)", rows)
+    conn.close()
+
+    with open(env["WEIGHTS_FILE"], "w") as f:
+        json.dump({"version": 2, "weights": weights}, f, separators=(",", ":"))
+
+# ---- stage timing (runs in a child process so every size gets fresh modules) ----
+
+STAGE_CHILD = """
+import asyncio, json, sys
+from backend.bench.suite import time_stages
+print(json.dumps(asyncio.run(time_stages(int(sys.argv[1]), int(sys.argv[2])))))
+"""
+
+async def time_stages(sessions: int, iterations: int) -> dict:
+    """Time each stage of a turn against the seeded data already pointed to by the environment."""
+    t0 = time.perf_counter()
+    from backend.app import claude, history, retrieval, store
+    from backend.app.intents import classify_intent
+    from backend.app.routes import _rank
+    store.load()
+    history.load()
+    retrieval.build(data for _, data in history.iter_sessions(retrieval.BUILD_SESSIONS))
+    startup = time.perf_counter() - t0
+
+    claude.init_client()
+    rng = random.Random(1)
+    timings = {stage: [] for stage in STAGES}
+
+    def timed(stage, fn, *args):
+        t = time.perf_counter()
+        out = fn(*args)
+        timings[stage].append(time.perf_counter() - t)
+        return out
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(iterations):
+            session_id = f"s{rng.randrange(sessions)}" if i % 2 else f"new-{i}"
+            context = rng.choice(CONTEXTS)
+            text = f"{rng.choice(HEARD)} ({i})"
+
+            intent = timed("classify", classify_intent, text)
+            conversation_history = timed("history", history.get_history_for_llm, session_id)
+            common_replies = timed("common_replies", history.get_common_replies, context)
+
+            t = time.perf_counter()
+            replies = await claude.generate_replies(text, context, conversation_history, common_replies)
+            timings["llm"].append(time.perf_counter() - t)
+
+            suggestions = timed("rank", _rank, context, intent, replies)
+
+            t = time.perf_counter()
+            history.add_exchange(session_id, context, text)
+            history.update_last_exchange_with_choice(session_id, suggestions[0].text)
+            store.bump(context, intent, suggestions[0].text)
+            timings["persist"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        history.flush()
+        store.save()
+        flush = time.perf_counter() - t
+    await claude.close_client()
+
+    return {
+        "startup_ms": startup * 1000,
+        "flush_ms": flush * 1000,
+        "stages": {
+            stage: {"p50_ms": percentile(v, 0.5) * 1000, "p99_ms": percentile(v, 0.99) * 1000}
+            for stage, v in timings.items()
+        },
+    }
+
+# ---- HTTP load ----
+
+async def drive(base: str, sessions: int, users: int, turns: int) -> dict:
+    """`users` concurrent clients each run `turns` turns of suggest -> log_choice, clearing now and then."""
+    latencies = {"/suggest": [], "/log_choice": [], "/clear_history": []}
+    rng = random.Random(2)
+
+    async with httpx.AsyncClient(base_url=base, timeout=60) as http:
+        async def call(path, body):
+            t = time.perf_counter()
+            r = await http.post(path, json=body)
+            r.raise_for_status()
+            latencies[path].append(time.perf_counter() - t)
+            return r.json()
+
+        async def user(u):
+            session_id = f"s{rng.randrange(sessions)}" if u % 2 else f"http-{u}"
+            context = rng.choice(CONTEXTS)
+            for turn in range(turns):
+                out = await call("/suggest", {
+                    "session_id": session_id,
+                    "last_text": f"{rng.choice(HEARD)} ({u}.{turn})",
+                    "context": context,
+                })
+                choice = out["suggestions"][0]
+                await call("/log_choice", {
+                    "session_id": session_id,
+                    "suggestion_id": choice["id"],
+                    "context": context,
+                    "intent": choice["intent"],
+                    "text": choice["text"],
+                })
+                if turn % 10 == 9:
+                    await call("/clear_history", {"session_id": session_id})
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user(u) for u in range(users)))
+        wall = time.perf_counter() - t0
+
+    return {
+        path: {
+            "count": len(v),
+            "p50_ms": percentile(v, 0.5) * 1000,
+            "p99_ms": percentile(v, 0.99) * 1000,
+            "rps": len(v) / wall,
+        }
+        for path, v in latencies.items() if v
+    }
+
+def bench_size(sessions: int, args) -> dict:
+    tmp = tempfile.mkdtemp(prefix=f"ichack-bench-{sessions}-")
+    t0 = time.perf_counter()
+    seed(tmp, sessions)
+    print(f"  seeded in {time.perf_counter() - t0:.1f} s")
+
+    env = {**os.environ, **data_env(tmp),
+           "ANTHROPIC_API_KEY": "fake", "ANTHROPIC_BASE_URL": f"http://127.0.0.1:{args.fake_port}"}
+    out = subprocess.run(
+        [sys.executable, "-c", STAGE_CHILD, str(sessions), str(args.iterations)],
+        env=env, capture_output=True, text=True,
+    )
+    if out.returncode:
+        raise RuntimeError(f"stage timing failed:\n{out.stderr}")
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+
+    # The stage run wrote to the data; start the server from a fresh seed
+    tmp = tempfile.mkdtemp(prefix=f"ichack-bench-{sessions}-")
+    seed(tmp, sessions)
+    t0 = time.perf_counter()
+    backend = spawn("backend.app.main:app", args.port, {**env, **data_env(tmp)})
+    try:
+        wait_ready(f"http://127.0.0.1:{args.port}/health", timeout=600)
+        result["server_ready_ms"] = (time.perf_counter() - t0) * 1000
+        result["http"] = asyncio.run(drive(f"http://127.0.0.1:{args.port}", sessions, args.users, args.turns))
+    finally:
+        backend.terminate()
+        backend.wait()
+    return result
+
+def report(sessions: int, result: dict):
+    print(f"  startup {result['startup_ms']:.0f} ms (server ready {result['server_ready_ms']:.0f} ms), "
+          f"flush {result['flush_ms']:.1f} ms")
+    print(f"  {'stage':<16}{'p50 ms':>10}{'p99 ms':>10}")
+    for stage, t in result["stages"].items():
+        print(f"  {stage:<16}{t['p50_ms']:>10.3f}{t['p99_ms']:>10.3f}")
+    print(f"  {'endpoint':<16}{'p50 ms':>10}{'p99 ms':>10}{'req/s':>10}{'n':>7}")
+    for path, t in result["http"].items():
+        print(f"  {path:<16}{t['p50_ms']:>10.1f}{t['p99_ms']:>10.1f}{t['rps']:>10.1f}{t['count']:>7}")
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """p99s (stages and endpoints) that regressed against a saved run."""
+    regressions = []
+    for size, result in results.items():
+        base = baseline.get(size)
+        if not base:
+            continue
+        pairs = [(f"stage {s}", t, base["stages"].get(s)) for s, t in result["stages"].items()]
+        pairs += [(f"http {p}", t, base["http"].get(p)) for p, t in result["http"].items()]
+        for name, now, then in pairs:
+            if then and now["p99_ms"] > then["p99_ms"] * REGRESSION_RATIO \
+                    and now["p99_ms"] - then["p99_ms"] > REGRESSION_FLOOR_MS:
+                regressions.append(f"{size} sessions, {name}: p99 {then['p99_ms']:.2f} -> {now['p99_ms']:.2f} ms")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10,1000,100000")
+    ap.add_argument("--iterations", type=int, default=200, help="in-process turns per size")
+    ap.add_argument("--users", type=int, default=20, help="concurrent HTTP clients")
+    ap.add_argument("--turns", type=int, default=20, help="turns per HTTP client")
+    ap.add_argument("--latency-ms", type=float, default=50)
+    ap.add_argument("--fake-port", type=int, default=FAKE_PORT)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--save", help="write results as JSON")
+    ap.add_argument("--compare", help="baseline JSON from --save; exit 1 on regression")
+    args = ap.parse_args()
+
+    fake = spawn("backend.bench.fake_anthropic:app", args.fake_port, {"FAKE_LATENCY_MS": str(args.latency_ms)})
+    results = {}
+    try:
+        wait_ready(f"http://127.0.0.1:{args.fake_port}/stats")
+        for sessions in (int(s) for s in args.sizes.split(",")):
+            print(f"{sessions} sessions (fake LLM {args.latency_ms:.0f} ms)")
+            results[str(sessions)] = bench_size(sessions, args)
+            report(sessions, results[str(sessions)])
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f))
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
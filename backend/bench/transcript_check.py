@@ -0,0 +1,146 @@
+"""
+Check of history's transcript diffing (_split_new) over simulated conversations.
+
+The frontend sends the whole transcript so far on every request, as the
+browser's recognizer renders it: case and punctuation of earlier words may
+change from one request to the next. This plays random conversations
+through new_speech and add_exchange on a temp database, one step at a time:
+
+    more       the other person says more; the transcript grows
+    echo       the user speaks the reply they chose, then the other person goes on
+    bare echo  ...or stops right after it
+    repeat     the same transcript again (double tap, recognition restart)
+    reset      the recognizer starts over with a fresh transcript
+
+and checks that:
+
+  - new_speech returns just what was said since the last request (the
+    last exchange's transcript for a repeat; never the echoed reply)
+  - the session's exchanges hold exactly those words, nothing for
+    repeats or a bare echo
+  - a session stored before diffing (no "heard") diffs against its last
+    exchange's transcript
+
+    python -m backend.bench.transcript_check --conversations 200 --steps 30
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+from collections import Counter
+
+SPEECH = ("the table for two water doctor appointment tomorrow how are you today menu "
+          "please pain since monday bill card here over there would like to order").split()
+REPLIES = ["Yes, please.", "No thank you", "Could you repeat that?", "I'm fine."]
+
+results = []
+
+def check(name: str, ok: bool, detail: str):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+
+def render(rng: random.Random, words: list[str]) -> str:
+    """Words as a recognizer might show them this time: some capitalized, some with punctuation."""
+    out = []
+    for word in words:
+        if rng.random() < 0.2:
+            word = word.capitalize()
+        if rng.random() < 0.15:
+            word += rng.choice([",", ".", "?"])
+        out.append(word)
+    return " ".join(out)
+
+def converse(history, rng: random.Random, session_id: str, steps: int, counts: Counter, failures: list):
+    norm = lambda text: [history._norm(w) for w in text.split()]
+    said = []        # every word in the current transcript
+    exchanges = []   # normalized words of each stored exchange
+    chosen = None    # the reply chosen for the last exchange
+    for step in range(steps):
+        speech = rng.choices(SPEECH, k=rng.randint(1, 6))
+        while said and speech[:len(said)] == said:
+            # A fresh transcript that starts with the old one is indistinguishable from more speech
+            speech = rng.choices(SPEECH, k=rng.randint(1, 6))
+        r = rng.random()
+        if not said or r < 0.4:
+            kind, said, new = ("more", said + speech, speech) if said else ("reset", speech, speech)
+        elif r < 0.6 and chosen:
+            echo = norm(chosen)
+            if rng.random() < 0.3:
+                kind, said, new = "bare echo", said + echo, []
+            else:
+                kind, said, new = "echo", said + echo + speech, speech
+        elif r < 0.8:
+            kind, new = "repeat", None
+        else:
+            kind, said, new = "reset", speech, speech
+        counts[kind] += 1
+
+        transcript = render(rng, said)
+        got = norm(history.new_speech(session_id, transcript))
+        want = (exchanges[-1] if exchanges else []) if new is None else new
+        if got != want:
+            failures.append(f"{session_id} step {step} ({kind}): new_speech gave {got}, expected {want}")
+
+        history.add_exchange(session_id, "generic", transcript)
+        if new:
+            exchanges.append(new)
+            chosen = None
+        stored = history._session(session_id)
+        stored = [norm(ex["transcript"]) for ex in stored["exchanges"]] if stored else []
+        if stored != exchanges[-history.MAX_HISTORY_PER_SESSION:]:
+            failures.append(f"{session_id} step {step} ({kind}): stored {stored}, expected {exchanges}")
+
+        if exchanges and rng.random() < 0.5:
+            chosen = rng.choice(REPLIES)
+            history.update_last_exchange_with_choice(session_id, chosen)
+
+def legacy_session(history) -> tuple[bool, str]:
+    """A session stored before diffing: full transcripts, no "heard"."""
+    data = {"context": "generic", "exchanges": [
+        {"timestamp": "", "transcript": "Good morning", "chosen_reply": None},
+        {"timestamp": "", "transcript": "Good morning. A table for two?", "chosen_reply": "Yes, please."},
+    ]}
+    got = [
+        history._split_new(data, "good morning a table for two yes please by the window")[0],
+        history._split_new(data, "Good morning, a table for two?")[2],
+    ]
+    want = [["by", "the", "window"], True]
+    return got == want, f"got {got}, expected {want}"
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--conversations", type=int, default=200)
+    ap.add_argument("--steps", type=int, default=30)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="ichack-transcript-")
+    os.environ["HISTORY_DB"] = os.path.join(tmp, "conversation_history.db")
+    os.environ["HISTORY_FILE"] = os.path.join(tmp, "conversation_history.json")
+    from backend.app import history
+    history.load()
+
+    rng = random.Random(args.seed)
+    counts = Counter()
+    failures = []
+    try:
+        for c in range(args.conversations):
+            converse(history, rng, f"conv-{c}", args.steps, counts, failures)
+        legacy_ok, legacy_detail = legacy_session(history)
+    finally:
+        history._conn.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    steps = args.conversations * args.steps
+    print(f"{args.conversations} conversations, {steps} steps: "
+          + ", ".join(f"{counts[k]} {k}" for k in ("more", "echo", "bare echo", "repeat", "reset")))
+    check("new speech and stored exchanges match what was said", not failures,
+          f"{steps} steps" + (f", {len(failures)} wrong; first: {failures[0]}" if failures else ""))
+    check("sessions stored before diffing diff against their last transcript", legacy_ok, legacy_detail)
+    print(f"{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
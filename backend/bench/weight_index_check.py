@@ -0,0 +1,133 @@
+"""
+Equivalence check for weight_index's prefix-filtered lookup.
+
+Prefix filtering is only an optimization if it never misses a match. This
+builds an index over synthetic replies, then compares matches() for many
+candidates with a brute-force scan of every stored form under the same
+word weights:
+
+  - a candidate with fewer than MAX_MATCHES matches must get exactly the
+    brute-force groups, with the same similarities
+  - one with more must get MAX_MATCHES groups, all of them real matches
+
+Replies are phrasepack and LLM replies, variants of them (numbered as the
+bench suite numbers them, words dropped or added, case and punctuation
+changed), dense families of one reply with a word added, and random
+sentences over a Zipf-distributed vocabulary.
+Candidates are stored replies, fresh variants and unrelated sentences.
+
+    python -m backend.bench.weight_index_check --replies 3000 --queries 2000
+"""
+import argparse
+import random
+import sys
+import time
+
+from backend.app import weight_index
+from backend.app.phrasepacks import PHRASEPACKS
+
+from .fake_anthropic import REPLIES
+
+results = []
+
+def check(name: str, ok: bool, detail: str):
+    results.append(ok)
+    print(f"  [{'PASS' if ok else 'FAIL'}] {name}: {detail}")
+
+def corpus(rng: random.Random, n: int):
+    """n stored replies, plus functions making a variant of a text and a random sentence."""
+    seeds = [r for pack in PHRASEPACKS.values() for r in pack] + list(REPLIES)
+    words = sorted({w for s in seeds for w in weight_index.canonical(s).split()})
+    words += [f"w{i}" for i in range(400)]
+    zipf = [1 / (i + 1) for i in range(len(words))]
+
+    def sentence() -> str:
+        return " ".join(rng.choices(words, zipf, k=rng.randint(2, 12))).capitalize() + "."
+
+    def variant(text: str) -> str:
+        tokens = text.split()
+        kind = rng.randrange(4)
+        if kind == 0:
+            return f"{text.rstrip('.?!')} ({rng.randrange(1000)})."
+        if kind == 1 and len(tokens) > 1:
+            del tokens[rng.randrange(len(tokens))]
+        elif kind == 2:
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choices(words, zipf)[0])
+        else:
+            tokens = [t.upper() if rng.random() < 0.3 else t for t in tokens]
+            return " ".join(tokens).rstrip(".") + "!"
+        return " ".join(tokens)
+
+    stored = list(seeds)
+    # A few dense families, so some candidates have more than MAX_MATCHES matches
+    for base in rng.sample(seeds, 4):
+        for _ in range(2 * weight_index.MAX_MATCHES):
+            tokens = base.split()
+            tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(words[:60]))
+            stored.append(" ".join(tokens))
+    while len(stored) < n:
+        r = rng.random()
+        stored.append(variant(rng.choice(stored)) if r < 0.6 else sentence())
+    return stored, variant, sentence
+
+def brute_force(forms, text: str) -> dict:
+    """form -> similarity for every stored form matching `text`."""
+    idf, unseen = forms.idf, forms.unseen_idf
+    weight = lambda ws: sum(idf.get(w, unseen) for w in ws)
+    form = weight_index.canonical(text)
+    words = set(form.split())
+    out = {}
+    for other, other_words in forms.words.items():
+        if other == form:
+            out[other] = 1.0
+            continue
+        common = weight(words & other_words)
+        sim = common / (weight(words) + weight(other_words) - common)
+        if sim >= weight_index.MIN_SIMILARITY - 1e-9:
+            out[other] = sim
+    return out
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--replies", type=int, default=3000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = random.Random(args.seed)
+    stored, variant, sentence = corpus(rng, args.replies)
+    forms = weight_index._Forms(stored)
+    group = {id(texts): form for form, texts in forms.texts.items()}
+
+    exact = capped = 0
+    missed, wrong = [], []
+    lookup = 0.0
+    for _ in range(args.queries):
+        r = rng.random()
+        text = rng.choice(stored) if r < 0.3 else variant(rng.choice(stored)) if r < 0.8 else sentence()
+        t = time.perf_counter()
+        got = {group[id(texts)]: sim for texts, sim in forms.matches(text)}
+        lookup += time.perf_counter() - t
+        want = brute_force(forms, text)
+
+        if len(want) < weight_index.MAX_MATCHES:
+            exact += 1
+            if got.keys() != want.keys() or any(abs(got[f] - want[f]) > 1e-9 for f in got):
+                missed.append(text)
+        else:
+            capped += 1
+            if len(got) != weight_index.MAX_MATCHES or not got.keys() <= want.keys():
+                wrong.append(text)
+
+    print(f"{len(forms.texts)} forms from {len(stored)} replies, {args.queries} candidates, "
+          f"{lookup / args.queries * 1000:.3f} ms per lookup")
+    check("same matches as a brute-force scan", not missed,
+          f"{exact - len(missed)}/{exact} candidates agree" + (f", e.g. {missed[0]!r}" if missed else ""))
+    check("capped lookups return MAX_MATCHES real matches", not wrong,
+          f"{capped - len(wrong)}/{capped} candidates with {weight_index.MAX_MATCHES}+ matches"
+          + (f", e.g. {wrong[0]!r}" if wrong else ""))
+    print(f"{sum(results)}/{len(results)} checks passed")
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
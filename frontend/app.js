@@ -199,6 +199,10 @@ if (SpeechRecognition) {
         interimTranscript += transcript;
       }
     }
+
+    if (interimTranscript) {
+      sendLive('interim', transcript + interimTranscript);
+    }
   };
 
   recognition.onerror = (event) => {
@@ -232,6 +236,7 @@ async function toggleSpeechRecording() {
 
       recognition.start();
       isRecording = true;
+      connectLive();
       recordingToggle.classList.add('recording');
       recordingToggle.classList.remove('paused');
       recordingToggle.title = 'Pause Recording';
@@ -253,27 +258,50 @@ async function toggleSpeechRecording() {
 }
 
 async function sendTranscriptToBackend(text) {
-  try {
-    // Update the transcript state
-    transcript += text + ' ';
-    console.log('📝 Total transcript accumulated:', transcript);
-    console.log('📊 Transcript length:', transcript.length, 'characters');
-    
-    // Optionally auto-refresh contextual suggestions when new speech is detected
-    // Uncomment the line below if you want automatic refresh
-    // await autoRefreshSuggestions();
-    
-  } catch (error) {
-    console.error('Failed to process transcript:', error);
-  }
+  // addTranscriptSentence has already appended it to the cumulative transcript
+  console.log('📝 Total transcript accumulated:', transcript);
+  console.log('📊 Transcript length:', transcript.length, 'characters');
+  sendLive('final', transcript);
 }
 
-async function autoRefreshSuggestions() {
-  try {
-    const suggestions = await fetchSuggestions();
-    renderContextualButtons(suggestions);
-  } catch (error) {
-    console.error('Failed to auto-refresh suggestions:', error);
+// Live suggestions: interim and final transcripts go over one WebSocket and
+// the backend pushes suggestions back as they are ready. It debounces interim
+// results and drops work for speech that has been superseded.
+let liveSocket = null;
+let liveSeq = 0;
+
+function connectLive() {
+  if (liveSocket) return;
+  const base = API_BASE.replace(/^http/, 'ws');
+  liveSocket = new WebSocket(
+    `${base}/suggest/live/${encodeURIComponent(sessionId)}?context=${encodeURIComponent(selectedContext.value)}`
+  );
+  liveSeq = 0;
+
+  liveSocket.onmessage = (event) => {
+    const data = JSON.parse(event.data);
+    if (data.type === 'error') {
+      console.error('Live suggestions error:', data.detail);
+      return;
+    }
+    // A push for older speech can still arrive after a newer one; keep the newest
+    if (data.seq < liveSeq) return;
+    liveSeq = data.seq;
+    if (data.type === 'suggestions') {
+      console.log('💬 Suggestions received:', data.suggestions.map(s => s.text));
+    }
+    renderContextualButtons(data.suggestions);
+  };
+
+  liveSocket.onclose = () => {
+    liveSocket = null;
+    if (isRecording) setTimeout(connectLive, 1000);
+  };
+}
+
+function sendLive(type, text) {
+  if (liveSocket && liveSocket.readyState === WebSocket.OPEN) {
+    liveSocket.send(JSON.stringify({ type, text, context: selectedContext.value }));
   }
 }
 
@@ -306,8 +334,7 @@ refreshBtn.addEventListener('click', async () => {
   refreshBtn.textContent = '⏳';
   
   try {
-    const suggestions = await fetchSuggestions();
-    renderContextualButtons(suggestions);
+    await streamSuggestions(renderContextualButtons);
     showStatus('Suggestions refreshed', 'success');
   } catch (error) {
     showStatus('Failed to fetch suggestions', 'error');
@@ -317,30 +344,61 @@ refreshBtn.addEventListener('click', async () => {
   }
 });
 
-async function fetchSuggestions() {
+// Streamed variant: phrasepack first, then Claude replies as they arrive, then the ranked list
+async function streamSuggestions(onUpdate) {
   const payload = {
     session_id: sessionId,
     last_text: transcript,
-    context: selectedContext.value,
-    mode: "contextual"
+    context: selectedContext.value
   };
 
-  console.log('📤 Sending to backend:', payload);
-  console.log('📝 Transcript being sent:', transcript);
-
-  const res = await fetch(`${API_BASE}/suggest`, {
+  const res = await fetch(`${API_BASE}/suggest/stream`, {
     method: "POST",
     headers: { "Content-Type": "application/json" },
     body: JSON.stringify(payload)
   });
 
-  if (!res.ok) throw new Error('Suggest failed');
-  const data = await res.json();
-  
-  console.log('✅ Backend response:', data);
-  console.log('💬 Suggestions received:', data.suggestions.map(s => s.text));
-  
-  return data.suggestions || [];
+  if (!res.ok || !res.body) throw new Error('Suggest failed');
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let fallback = [];
+  const streamed = [];
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      const event = (raw.match(/^event: (.*)$/m) || [])[1];
+      const data = JSON.parse((raw.match(/^data: (.*)$/m) || [])[1] || 'null');
+
+      if (event === 'fallback') {
+        fallback = data.suggestions;
+        onUpdate(fallback);
+      } else if (event === 'reply') {
+        streamed.push({
+          id: `${selectedContext.value}:${data.intent}:${data.index}`,
+          text: data.text,
+          intent: data.intent,
+          score: 1.0
+        });
+        // Streamed replies take over the phrasepack slots one by one
+        onUpdate([...streamed, ...fallback.slice(streamed.length)]);
+      } else if (event === 'final') {
+        console.log('💬 Suggestions received:', data.suggestions.map(s => s.text));
+        onUpdate(data.suggestions);
+        return data.suggestions;
+      }
+    }
+  }
+
+  return streamed;
 }
 
 function renderContextualButtons(suggestions) {